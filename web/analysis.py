@@ -1,28 +1,17 @@
-import requests
 import pandas as pd
 import numpy as np
 
-import yfinance as yf
+import price_store
+import indicators
+import metrics
 
-import matplotlib.pyplot as plt
+import sqlite3
 
 from mv_avg_window_optimizer import Optimized_Symbol
 
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
-import plotly.express as px
-import plotly.io as pio
-pio.renderers.default = "browser"
-
-# NLP stuff
-# import sklearn
-import nltk, re, sqlite3
-from nltk.tokenize import word_tokenize, sent_tokenize
-from nltk.corpus import stopwords
-from nltk.sentiment import SentimentIntensityAnalyzer
-from collections import Counter
-
-from bs4 import BeautifulSoup
+# requests, yfinance, matplotlib, plotly, nltk and BeautifulSoup take most of
+# a second to import between them, so they are imported by the functions that
+# use them and the web worker and batch jobs only load what they need
 
 from datetime import datetime
 
@@ -88,75 +77,42 @@ class StockData:
                 index=False)
     
     def get_biggest_gainers(self) -> pd.DataFrame:
+        import requests
         r = requests.get('https://www.dogsofthedow.com/biggest-stock-gainers-today.htm')
         gainers_df = pd.read_html(r.text)[0]
         return gainers_df
 
     def get_history(self, ticker, period) -> pd.DataFrame:
-        t = yf.Ticker(ticker)
-        return t.history(period)
+        return price_store.get_history(ticker, period)
 
-    def build_stocks_df(self, gainers_df) -> pd.DataFrame:
-        loop = 0
+    def build_stocks_df(self, gainers_df, workers=8) -> pd.DataFrame:
+        """
+        Downloads every gainer's history concurrently and stacks them, indexed
+        by Date with a Symbol column. Symbols that fail to download are skipped.
+        """
         period = "12mo"
-        for s in gainers_df['Symbol']:
-            if loop == 0:
-                df = self.get_history(s, period=period)
-                df['Symbol'] = s
-                loop +=1
-            else:
-                temp_df = self.get_history(s, period=period)
-                temp_df['Symbol'] = s
-                df = pd.concat([df, temp_df])  
-        return df
+        stacked = price_store.load_histories(gainers_df['Symbol'], period=period, workers=workers)
+        # (Symbol, Date) MultiIndex -> Date index with a Symbol column
+        df = stacked.reset_index('Symbol')
+        # keep the columns in the order the rest of the pipeline expects
+        return df[[c for c in df.columns if c != 'Symbol'] + ['Symbol']]
     
     def n_day_moving_average(self, rolling_window=20):
         """
         Calculates and creates twenty day moving average values into the dataframe
         """
-        # reset the index to an array
         df = self.history_df.copy()
-        df.reset_index(inplace=True)
-        for symbol in df['Symbol'].unique():
-            # get min and max index references to pass to .loc later
-            idx_ref_min = min(df[df['Symbol']==symbol].index)
-            idx_ref_max = max(df[df['Symbol']==symbol].index)
-            
-            close_series = df[df['Symbol']==symbol]['Close']
-            rolling = close_series.rolling(window=rolling_window)
-            twenty_day_rolling = rolling.mean()
-            
-            # set twenty day rolling average at proper indexes for given symbol
-            df.loc[idx_ref_min:idx_ref_max+1,f'optimum_day_moving_average'] = twenty_day_rolling
-            
-        df.set_index('Date', inplace=True)
-        return df
+        return indicators.add_moving_average(df, rolling_window)
     
     def bolinger_bands(self, rolling_avg_col, rolling_window):
         """
         Calculates and creates bolinger band values (upper and lower) into the dataframe
         """
-        # reset the index to an array
-        df = self.ma_df
-        df.reset_index(inplace=True)
-        for symbol in df['Symbol'].unique():
-            # get min and max index references to pass to .loc later
-            idx_ref_min = min(df[df['Symbol']==symbol].index)
-            idx_ref_max = max(df[df['Symbol']==symbol].index)
-            
-            n_day_rolling = df[df['Symbol']==symbol][rolling_avg_col].rolling(window=rolling_window)
-            standard_dev = n_day_rolling.std()
-            
-            # set twenty day rolling average at proper indexes for given symbol
-            df.loc[idx_ref_min:idx_ref_max+1,'bolinger_upper_band'] = df.loc[idx_ref_min:idx_ref_max+1,rolling_avg_col] + standard_dev*2
-            df.loc[idx_ref_min:idx_ref_max+1,'bolinger_lower_band'] = df.loc[idx_ref_min:idx_ref_max+1,rolling_avg_col] - standard_dev*2
-            
-        df.set_index('Date', inplace=True)
-
-        return df       
+        return indicators.add_bollinger_bands(self.ma_df, rolling_avg_col, rolling_window)
 
 
 def graph_trend(df, symbol):
+    import matplotlib.pyplot as plt
     x=np.array([n for n in range(0,len(df[df['Symbol']==symbol]))])
     y=np.array(df[df['Symbol']==symbol]['Close'])
     a, b = np.polyfit(x, y, 1)
@@ -174,38 +130,36 @@ def find_positive_trends(df, bol_df):
     """
     returns the symbols with positive trend slopes over the history of the data
     """
-    for symbol in df['Symbol'].unique():
-        a = get_trend_slope(bol_df, symbol)
+    slopes = indicators.trend_fit(bol_df['Close'], bol_df['Symbol'])['trend_slope']
+    for symbol, a in slopes[slopes.index.isin(df['Symbol'].unique())].items():
         if a > 0:
             print(f'{symbol} a greater than 0: {a}')
             
-def trend_slope(df, bol_df, symbol_col):
-    for symbol in bol_df[symbol_col].unique():
-        a = get_trend_slope(bol_df, symbol)
-        idx = df[df[symbol_col] == symbol].index
-        df.loc[idx, 'trend_slope'] = a
-    return df
+def trend_slope(df, bol_df, symbol_col, columns=('trend_slope',)):
+    """
+    Joins each symbol's trend fit over `bol_df` onto `df`. `columns` picks which
+    of the trend_fit columns to add.
+    """
+    fit = indicators.trend_fit(bol_df['Close'], bol_df[symbol_col])
+    fit.index.name = symbol_col
+    df = df.drop(columns=list(columns), errors='ignore')
+    return df.join(fit[list(columns)], on=symbol_col)
+
+def universe_trends(symbols, period="12mo", workers=8) -> pd.DataFrame:
+    """
+    Trend fit for any number of symbols (e.g. the whole NASDAQ screener list)
+    straight from the price store, one row per symbol.
+    """
+    stacked = price_store.load_histories(symbols, period=period, workers=workers)
+    if stacked.empty:
+        return indicators.trend_fit([], [])
+    return indicators.trend_fit(stacked['Close'], stacked.index.get_level_values('Symbol'))
             
 def n_day_moving_average(df, rolling_window):
     """
     Calculates and creates twenty day moving average values into the dataframe
     """
-    # reset the index to an array
-    df.reset_index(inplace=True)
-    for symbol in df['Symbol'].unique():
-        # get min and max index references to pass to .loc later
-        idx_ref_min = min(df[df['Symbol']==symbol].index)
-        idx_ref_max = max(df[df['Symbol']==symbol].index)
-        
-        close_series = df[df['Symbol']==symbol]['Close']
-        rolling = close_series.rolling(window=rolling_window)
-        twenty_day_rolling = rolling.mean()
-        
-        # set twenty day rolling average at proper indexes for given symbol
-        df.loc[idx_ref_min:idx_ref_max+1,f'optimum_day_moving_average'] = twenty_day_rolling
-        
-    df.set_index('Date', inplace=True)
-    return df
+    return indicators.add_moving_average(df, rolling_window)
      
 # def bolinger_bands(df, rolling_avg_col, rolling_window):
 #     """
@@ -231,6 +185,9 @@ def n_day_moving_average(df, rolling_window):
 
 
 def plotly_plot_bolinger(df, symbol, window):
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    pio.renderers.default = "browser"
     pd.options.plotting.backend = "plotly"
     # fig = df[df['Symbol']==symbol][['Close', f'{window}_day_moving_average', 'bolinger_upper_band', 'bolinger_lower_band']].plot(title=symbol)
     x_axis=df[df['Symbol']==symbol].index
@@ -254,24 +211,20 @@ def plotly_plot_bolinger(df, symbol, window):
     return fig
 
 ######################### News Article Analysis ###############################
-import nltk
-from nltk import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords
- 
-# Dict subclass for counting hashable items. Sometimes called a bag or multiset. Elements are stored as dictionary keys and their counts are stored as dictionary values.
-from collections import Counter
+import nlp
 
-import re
+# seconds before an article download is abandoned
+ARTICLE_REQUEST_TIMEOUT = 10
         
 def is_ok(token):
-    stop = set(stopwords.words('english'))
-    return re.match('^[a-z]+$', token) and token not in stop
+    return nlp.get_engine().is_ok(token)
 
 def tokenize(sent):
-    return [word for word in word_tokenize(sent) if is_ok(word)]
+    return nlp.get_engine().tokenize(sent)
 
 class News():
     def __init__(self, ticker):
+        import yfinance as yf
         self.ticker = yf.Ticker(ticker)
         
     # scrape URL Links from news
@@ -302,45 +255,27 @@ class Article:
        
     def get_article_contents(self, url):
         """Gets the full text of a given Yahoo Finance article given by the url"""
-        r = requests.get(url).text
-        soup = BeautifulSoup(r, 'html.parser')
+        import requests
+        from bs4 import BeautifulSoup
+        with metrics.timed('article_scrape'):
+            r = requests.get(url, timeout=ARTICLE_REQUEST_TIMEOUT).text
+            soup = BeautifulSoup(r, 'html.parser')
 
-        p = soup.find_all('p')
+            p = soup.find_all('p')
 
-        p_list = [text.get_text() for text in p]
-        full_text = ' '.join(p_list)
+            p_list = [text.get_text() for text in p]
+            full_text = ' '.join(p_list)
 
         return full_text
 
     def summarize(text, n=5):
-        # Tokenize the sentence
-        sents = sent_tokenize(text.contents)
-        # Get a "bill of words" or all words in all sentences that is_ok() 
-        bow = [tokenize(sent) for sent in sents]
-        # create a counter object to be used to count the words
-        tf = Counter()
-
-        # Iterate through the sentences in the bow
-        for sent in bow:
-            tf.update(sent)
-
-        def score(i):
-            return sum(tf[word] for word in bow[i])
-
-        idx = sorted(range(len(bow)), key=score, reverse=True)[:n]
-        summary_list = [sents[i] for i in idx]
-        summary_text = ' '.join(summary_list)
-        fail = 'Our engineers are working quickly to resolve the issue.'
-        if summary_text != fail:
-            return summary_text
+        return nlp.get_engine().summarize(text.contents, n)
         
     def polarity_scores(self):
-        if self.contents != 'Thank you for your patience. Our engineers are working quickly to resolve the issue.':
-            self.polarity_score = SentimentIntensityAnalyzer().polarity_scores(self.contents)
-            return self.polarity_score
-        else:
-            return 'No article contents found.'
-
-
-
+        self.polarity_score = nlp.get_engine().polarity_scores(self.contents)
+        return self.polarity_score
 
+    def analyze(self, n=5):
+        """Summary and polarity scores together, from the shared NLP engine."""
+        self.summary, self.polarity_score = nlp.get_engine().analyze(self.contents, n)
+        return self.summary, self.polarity_score
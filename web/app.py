@@ -1,17 +1,31 @@
-from flask import Flask, render_template, redirect, url_for
+from flask import Flask, render_template, redirect, url_for, jsonify, request, abort, Response, stream_template, make_response
 #from turbo_flask import Turbo
 
-import yfinance as yf
-
 import pandas as pd
 import json
-import plotly
+import hashlib
+import html
+import logging
 import analysis
-import plotly.graph_objects as go
-import sqlite3, psycopg2
+import sqlite3
+import database
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FetchTimeout
+from time import monotonic
 from datetime import datetime, date, time
 from mv_avg_window_optimizer import Optimized_Symbol
+import price_store
+import leaderboard
+import http_cache
+import metrics
+import chart_payload
+import dataset
+import article_store
+import news_ingest
+import nlp
+from cache import TTLCache
+from jobs import JobQueue, JobStore
 from config import HOME_DIR
 
 # import logging
@@ -22,9 +36,35 @@ from config import HOME_DIR
 #                     format='%(asctime)s: %(name)s - %(levelname)s - %(message)s')
 
 app = Flask(__name__)
+http_cache.init_app(app)
+metrics.init_app(app)
 #Turbo-flask : https://blog.miguelgrinberg.com/post/dynamically-update-your-flask-web-pages-using-turbo-flask
 # turbo = Turbo(app)
 
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 16))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+
+# shared by every request for the external fetches on the stock page
+fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='fetch')
+# seconds to wait for the last price, the news list and the database reads
+FETCH_TIMEOUT = float(os.environ.get('FETCH_TIMEOUT', 5))
+# seconds to wait for the articles once they have all been requested
+ARTICLE_TIMEOUT = float(os.environ.get('ARTICLE_TIMEOUT', 5))
+
+# background refreshes started from the pages; the job records are shared
+# by every server worker, so any of them can report a job's status
+job_store = JobStore()
+job_queue = JobQueue(workers=JOB_WORKERS, store=job_store)
+
+# 'compact' sends the stock chart as typed arrays, 'plotly' as the full figure JSON
+CHART_PAYLOAD = os.environ.get('CHART_PAYLOAD', 'compact')
+# downsample the stock chart to this many points; 0 keeps every bar
+CHART_MAX_POINTS = int(os.environ.get('CHART_MAX_POINTS', 0))
+
+# rendered stock page parts, keyed by (symbol, last bar date)
+stock_page_cache = TTLCache(ttl=int(os.environ.get('STOCK_PAGE_CACHE_TTL', 900)),
+                            max_bytes=int(os.environ.get('STOCK_PAGE_CACHE_MB', 64)) * 2**20)
+
 ########################################################################
 # Functional stuff
 def get_db_connection():
@@ -33,20 +73,20 @@ def get_db_connection():
     return conn
 
 def create_psql_db_connection():
-    conn = psycopg2.connect("dbname=stock_app user=stock_app password=stock_app_pi")
-    cur = conn.cursor()
-    return conn, cur
+    # borrowed from the shared pool; give it back with close_psql_db_connection
+    return database.create_db_connection()
 
 def close_psql_db_connection(conn, cur):
-    cur.close()
-    conn.close()
+    database.close_db_connection(conn, cur)
 
+@metrics.timed_function('sqlite_query')
 def read_bol_df():
     bol_df = pd.read_sql('SELECT * FROM bol_df', 
                          con=get_db_connection(),
                          index_col='Date')
     return bol_df
 
+@metrics.timed_function('sqlite_query')
 def read_today_results_df():
     df = pd.read_sql('SELECT * FROM today_results',
                        con=get_db_connection())
@@ -76,53 +116,43 @@ def read_optimization_params(symbol):
     close_psql_db_connection(conn, cur)
     return facts_table
     
-def read_top_100_sma(sort_by='single'):
+def read_top_100_sma(sort_by='single', page=1, per_page=100):
     '''
-    Reads the top 100 stocks sorted by return multiple
+    Reads the top 100 stocks sorted by the single or multi SMA return multiple
     '''
-    conn, cur = create_psql_db_connection()
     valid_sort_by = ['single', 'multi']
     if sort_by not in valid_sort_by:
         raise ValueError(f"Expected 'single' or 'multi'; got {sort_by}")
-    
-    query = """
-    SELECT symbol_id, symbol, last_updated, calc_period,
-    single_param_optimum_window, single_param_optimum_multiple, organic_growth 
-    FROM optimum_symbol_parameters
-    WHERE single_param_optimum_multiple IS NOT NULL
-    ORDER BY single_param_optimum_multiple DESC
-    LIMIT 100; 
-    """
-    
-    cur.execute(query)
-    table = pd.DataFrame(data=cur.fetchall(),
-                         columns=['symbol_id','symbol','last_updated','calc_period',
-                         'single_param_optimum_window','single_param_optimum_multiple','organic_growth'])
-    close_psql_db_connection(conn, cur)
-    return table
+    return leaderboard.read_page(sort_by, page, per_page)
 
-def read_top_100_exp_ma():
+def read_top_100_exp_ma(page=1, per_page=100):
     '''
     Reads the top 100 stocks sorted by return multiple
     '''
-    conn, cur = create_psql_db_connection()
-    
-    query = """
-    SELECT symbol_id, symbol, last_updated, calc_period,
-    exp_ma_optimum_window, exp_ma_optimum_multiple, organic_growth 
-    FROM optimum_symbol_parameters
-    WHERE exp_ma_optimum_multiple IS NOT NULL
-    ORDER BY exp_ma_optimum_multiple DESC
-    LIMIT 100; 
-    """
-    
-    cur.execute(query)
-    table = pd.DataFrame(data=cur.fetchall(),
-                         columns=['symbol_id','symbol','last_updated','calc_period',
-                                  'exp_ma_optimum_window', 'exp_ma_optimum_multiple'
-                                  ,'organic_growth'])
-    close_psql_db_connection(conn, cur)
-    return table
+    return leaderboard.read_page('exp_ma', page, per_page)
+
+def leaderboard_table(sort_by, page, per_page):
+    '''
+    The HTML table for one leaderboard page, rendered once per write
+    '''
+    def render():
+        table = leaderboard.read_page(sort_by, page, per_page)
+        link_frmt = lambda x: f'<a href="showLineChart/{x}">{x}</a>'
+        return table.drop(columns='symbol_id').to_html(formatters={'symbol':link_frmt},
+                                                       escape=False,
+                                                       index=False)
+    return leaderboard.cached_render(('table', sort_by, page, per_page), render)
+
+def leaderboard_args(default_sort_by, valid_sort_by):
+    sort_by = request.args.get('sort_by', default_sort_by)
+    if sort_by not in valid_sort_by:
+        abort(400, f"Expected one of {', '.join(valid_sort_by)}; got {sort_by}")
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', leaderboard.PER_PAGE))
+    except ValueError:
+        abort(400, 'page and per_page must be integers')
+    return leaderboard.page_info(sort_by, page, per_page)
     
 def indcate_buy_sell(current_price, sma_price):
     if current_price > sma_price:
@@ -144,7 +174,27 @@ def index():
            )
            )
 
+def sqlite_version(name):
+    conn = get_db_connection()
+    try:
+        return dataset.read_version(conn, name)
+    finally:
+        conn.close()
+
+def today_results_version(*args, **kwargs):
+    updated_at = sqlite_version('today_results')
+    return (updated_at, get_today()), http_cache.parse_timestamp(updated_at)
+
+def bol_df_version(*args, **kwargs):
+    updated_at = sqlite_version('bol_df')
+    return (updated_at,), http_cache.parse_timestamp(updated_at)
+
+def leaderboard_version(*args, **kwargs):
+    last_updated, rows = leaderboard.data_version()
+    return (last_updated, rows), http_cache.parse_timestamp(last_updated)
+
 @app.route("/home")
+@http_cache.conditional(today_results_version)
 def home():
     today_results_df = read_today_results_df()
     link_frmt = lambda x: f'<a href="showLineChart/{x}">{x}</a>'
@@ -165,125 +215,395 @@ def home():
                            title="Stock App"
                            )
 
-@app.route('/refresh_data')
-def rebuild():
+def rebuild_today_results(report=None):
+    """
+    Rebuilds `bol_df` and `today_results` from today's biggest gainers.
+    """
+    report = report or (lambda progress, message='': None)
+    report(0.0, 'Downloading gainers and price history')
     stockdata = analysis.StockData()
     bol_df = stockdata.bol_df
 
+    report(0.7, 'Writing bol_df')
     conn = get_db_connection()
     bol_df.to_sql('bol_df', 
                   con=conn, 
                   if_exists='replace')
+    dataset.ensure_indexes(conn)
     
+    report(0.85, 'Calculating trend slopes')
     today_results_df = analysis.trend_slope(stockdata.gainers_df, bol_df, 'Symbol')
     today_results_df.to_sql('today_results',
                             con=conn,
                             if_exists='replace')
-    
-    return redirect(url_for('home'))
+    dataset.record_version(conn, 'bol_df', 'today_results')
+
+def refresh_optimization(symbol, report=None):
+    """
+    Recalculates and stores the optimized parameters for one symbol.
+    """
+    report = report or (lambda progress, message='': None)
+    report(0.0, f'Optimizing {symbol}')
+    Optimized_Symbol(symbol).refresh()
+    invalidate_stock_page(symbol)
+
+def job_response(job):
+    response = jsonify(dict(job.to_dict(), status_url=url_for('job_status', job_id=job.id)))
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job.id)
+    return response
+
+@app.route('/refresh_data')
+def rebuild():
+    job = job_queue.submit(('refresh_data',), 'Rebuild today\'s results', rebuild_today_results)
+    return job_response(job)
 
 @app.route("/optimization_refresh/<symbol>")
 def optimization_refresh(symbol):
-    Optimized_Symbol(symbol).refresh()
-    return redirect('/showLineChart/' + symbol)
+    symbol = symbol.upper()
+    job = job_queue.submit(('optimization_refresh', symbol), f'Optimize {symbol}',
+                           refresh_optimization, symbol)
+    return job_response(job)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error=f'Unknown job {job_id}'), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs')
+def active_jobs():
+    return jsonify([job.to_dict() for job in job_queue.active_jobs()])
+
+@metrics.timed_function('last_price')
+def get_last_price(symbol):
+    import yfinance as yf
+    return yf.Ticker(symbol).basic_info['lastPrice']
+
+@metrics.timed_function('sqlite_query')
+def read_stored_articles(symbol):
+    conn = article_store.get_connection()
+    try:
+        return article_store.read_symbol_articles(conn, symbol)
+    finally:
+        conn.close()
+
+def store_articles(symbol, articles):
+    conn = article_store.get_connection()
+    try:
+        article_store.save_articles(conn, articles)
+        article_store.link_symbol(conn, symbol, [a['url'] for a in articles])
+    finally:
+        conn.close()
+
+def score_news_item(item):
+    article = news_ingest.fetch_article(item)
+    if article is None:
+        raise ValueError('no article contents')
+    article['summary'], article['polarity'] = nlp.get_engine().analyze(article['contents'])
+    return article
+
+def remaining(deadline):
+    return max(0.0, deadline - monotonic())
+
+def build_stock_page(symbol):
+    """
+    Builds the parts of the stock page that only change with a new daily bar or
+    a new optimization: the chart, the facts table, the exp. MA price and the
+    article sentiment. Returns (page parts, whether they can be cached).
+    Article sentiment comes from the article store, filled by news_ingest.py.
+    For a symbol it hasn't seen yet, the news and articles are fetched on
+    `fetch_pool` while the chart is built and then stored; anything that
+    misses its timeout is left out of the page, and a partial page isn't cached.
+    """
+    deadline = monotonic() + FETCH_TIMEOUT
+    stored_articles = read_stored_articles(symbol)
+    news_future = None if stored_articles else fetch_pool.submit(news_ingest.news_items, symbol)
 
-@app.route("/showLineChart/<symbol>")
-def showLineChart(symbol):
     # instantiate Optimized_Symbol
     opt = Optimized_Symbol(symbol)
+    # read the facts only now: for a symbol that wasn't in the database yet,
+    # the constructor has just optimized it and written its row
+    facts_future = fetch_pool.submit(read_optimization_params, symbol)
+    facts_deadline = monotonic() + FETCH_TIMEOUT
 
-    # get last price
-    last_price = yf.Ticker(symbol).basic_info['lastPrice']
-    str_last_price = '${:,.2f}'.format(round(last_price, 2))
-        
-    # get buy_sell indication
-    current_exp_ma_price = opt.two_ma_calc(opt.single_param_optimum_window, 
-                                        opt.multi_param_optimum_window_1, 
-                                        opt.multi_param_optimum_window_2, 
-                                        opt.exp_ma_optimum_window)['exp_ma'].iloc[-1]
-    buy_sell = indcate_buy_sell(float(last_price), current_exp_ma_price)
-    
     # Stock article stuff
+    cacheable = True
+    article_futures = {}
+    link_dict = {a['title']: [a['url'], a['polarity']] for a in stored_articles}
+    if news_future is not None:
+        try:
+            items = news_future.result(timeout=remaining(deadline))
+            for item in items:
+                article_futures[item['title']] = (item['link'], fetch_pool.submit(score_news_item, item))
+        except Exception as e:
+            # string keys, like the article titles; the template reads [link, note]
+            link_dict = {f'News unavailable: {e}': ['#', 'Failed']}
+            # try the news again on the next view
+            cacheable = False
+
+    # exp. MA price for the buy_sell indication
+    ma_df = opt.two_ma_calc(opt.single_param_optimum_window, 
+                            opt.multi_param_optimum_window_1, 
+                            opt.multi_param_optimum_window_2, 
+                            opt.exp_ma_optimum_window)
+    current_exp_ma_price = ma_df['exp_ma'].iloc[-1]
+    
+    graphJSON, chart = None, None
+    if CHART_PAYLOAD == 'compact':
+        # shared date axis and float32 series, decoded by the stock page
+        with metrics.timed('chart_payload'):
+            chart = chart_payload.to_json(opt.chart_payload(CHART_MAX_POINTS or None, ma_df))
+    else:
+        with metrics.timed('plotly_serialize'):
+            # create the plot object (trace)
+            trace = opt.plot_custom_ma()
+
+            # encode the plot object into json
+            import plotly
+            graphJSON = json.dumps(trace, cls=plotly.utils.PlotlyJSONEncoder)
+
     try:
-        news = analysis.News(symbol)
-        titles = news.get_titles()
-        urls = news.get_urls()
-        link_dict = {}
-        for idx, val in enumerate(titles):
-            link_dict[titles[idx]] = [urls[idx], analysis.Article(urls[idx]).polarity_scores()]
+        facts = facts_future.result(timeout=remaining(facts_deadline))
+        facts_table = facts.to_html(index=False)
+        if facts.empty:
+            # no row was written (the optimization failed); try again on the next view
+            cacheable = False
+    except FetchTimeout:
+        facts_table = '<p>Timed out loading the optimization results.</p>'
+        cacheable = False
     except Exception as e:
-        link_dict = {e:'Failed'}
-    
-    # TODO: update Optimized_Symbol to check db first before calculating attributes
-    facts_table = read_optimization_params(symbol)
-    
-    # create the plot object (trace)
-    trace = opt.plot_custom_ma()
-    
-    # encode the plot object into json
-    graphJSON = json.dumps(trace, cls=plotly.utils.PlotlyJSONEncoder)
+        facts_table = f'<p>Failed loading the optimization results: {html.escape(str(e))}</p>'
+        cacheable = False
+
+    # the articles started downloading together, so they share one deadline
+    article_deadline = monotonic() + ARTICLE_TIMEOUT
+    scored = []
+    for title, (url, future) in article_futures.items():
+        try:
+            article = future.result(timeout=remaining(article_deadline))
+            link_dict[title] = [url, article['polarity']]
+            scored.append(article)
+        except FetchTimeout:
+            link_dict[title] = [url, 'Timed out loading the article.']
+            cacheable = False
+        except Exception as e:
+            link_dict[title] = [url, f'Failed loading the article: {e}']
+    if scored:
+        store_articles(symbol, scored)
+
+    page = dict(graphJSON=graphJSON,
+                chart=chart,
+                facts_table=facts_table,
+                link_dict=link_dict,
+                current_exp_ma_price=float(current_exp_ma_price))
+    # fingerprint of everything cached above, for the page's ETag
+    parts = (graphJSON or chart, page['facts_table'], repr(sorted(link_dict.items(), key=str)),
+             repr(page['current_exp_ma_price']))
+    page['version'] = hashlib.sha1('\x00'.join(parts).encode()).hexdigest()
+    return page, cacheable
+
+# the last optimization_version read for each symbol, used while the database
+# is unreachable; bounded, since the symbol comes from the URL
+last_optimization_versions = TTLCache(ttl=stock_page_cache.ttl, max_bytes=2**20)
+
+def optimization_version(symbol):
+    """
+    When the symbol's optimum parameters were last written, by this or any
+    other process (another server worker, the nightly sweep).
+    """
+    symbol = symbol.upper()
+    try:
+        with database.get_pool().cursor() as cur:
+            cur.execute('SELECT last_updated FROM optimum_symbol_parameters WHERE symbol = %s;', (symbol,))
+            row = cur.fetchone()
+    except Exception as e:
+        logging.warning(f'Failed to read the optimization version of {symbol}: {e}')
+        return last_optimization_versions.get(symbol)
+    version = None if row is None else str(row[0])
+    last_optimization_versions.set(symbol, version)
+    return version
+
+def stock_page_key(symbol):
+    # a new daily bar or a new optimization makes a new entry, so the cache
+    # never serves yesterday's chart or parameters another worker replaced
+    history = price_store.get_history(symbol)
+    last_bar = None if history.empty else history.index[-1].date().isoformat()
+    return (symbol.upper(), last_bar, optimization_version(symbol))
+
+def get_stock_page(symbol):
+    return stock_page_cache.get_or_set(stock_page_key(symbol), lambda: build_stock_page(symbol))
+
+def invalidate_stock_page(symbol):
+    stock_page_cache.invalidate(lambda key: key[0] == symbol.upper())
+
+def warm_stock_page_cache(limit=100):
+    """
+    Builds the cached stock pages for the leaderboard symbols ahead of the first
+    visitor. Symbols that fail to build are skipped.
+    """
+    symbols = pd.concat([read_top_100_sma()['symbol'], read_top_100_exp_ma()['symbol']]).unique()
+    warmed = 0
+    for symbol in symbols[:limit]:
+        try:
+            get_stock_page(symbol)
+            warmed += 1
+        except Exception as e:
+            print(f'Failed to warm stock page cache for {symbol}: {e}')
+    return warmed
+
+def reset_after_fork():
+    """
+    Threads don't survive a fork, so a worker forked from a server process
+    that already used the pools (e.g. to warm the caches) gets its own.
+    """
+    global fetch_pool, job_queue
+    fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='fetch')
+    job_queue = JobQueue(workers=JOB_WORKERS, store=job_store)
+
+@app.route("/showLineChart/<symbol>")
+def showLineChart(symbol):
+    # the last price download runs while the rest of the page is built
+    last_price_future = fetch_pool.submit(get_last_price, symbol)
+    page = get_stock_page(symbol)
+
+    # get last price and buy_sell indication
+    try:
+        last_price = last_price_future.result(timeout=FETCH_TIMEOUT)
+        str_last_price = '${:,.2f}'.format(round(last_price, 2))
+        buy_sell = indcate_buy_sell(float(last_price), page['current_exp_ma_price'])
+    except Exception:
+        str_last_price = 'Unavailable'
+        buy_sell = ('Unknown', 'gray')
+
+    # the page only changes with the cached parts or the last price
+    etag, last_modified = http_cache.validators((page['version'], str_last_price, buy_sell))
+    if http_cache.is_fresh(etag, last_modified):
+        return http_cache.not_modified(etag, last_modified)
     
-    return render_template('stock_page.html',
+    html = render_template('stock_page.html',
                            title=symbol,
                            last_price=str_last_price,
-                           graphJSON=graphJSON,
+                           graphJSON=page['graphJSON'],
+                           chart=page['chart'],
                            symbol=symbol,
-                           link_dict=link_dict,
+                           link_dict=page['link_dict'],
                            refresh_opts=redirect('/optimization_refresh/' + symbol),
-                           facts_table=facts_table.to_html(
-                               index=False
-                           ),
+                           facts_table=page['facts_table'],
                            buy_sell=buy_sell)
+    return http_cache.set_validators(make_response(html), etag, last_modified)
     
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(stock_page_cache.stats())
+
+def dataset_filters():
+    '''
+    The symbol and date range filters for the dataset views, from the query string
+    '''
+    filters = dict(symbol=request.args.get('symbol') or None,
+                   start=request.args.get('start') or None,
+                   end=request.args.get('end') or None)
+    for key in ('start', 'end'):
+        if filters[key]:
+            try:
+                date.fromisoformat(filters[key])
+            except ValueError:
+                abort(400, f'{key} must be a YYYY-MM-DD date')
+    return filters
+
 @app.route('/data')
+@http_cache.conditional(bol_df_version)
 def data():
+    filters = dataset_filters()
+    conn = get_db_connection()
+    try:
+        columns = dataset.columns(conn)
+    finally:
+        conn.close()
+
+    def rows():
+        # opened once streaming starts and kept until the last row has been
+        # sent, so a response that is never sent holds no connection
+        if not columns:
+            return
+        conn = get_db_connection()
+        try:
+            for _, row in dataset.iter_rows(conn, **filters):
+                yield row
+        finally:
+            conn.close()
+
+    return Response(stream_template('dataset.html',
+                                    columns=columns,
+                                    rows=rows(),
+                                    filters=filters,
+                                    title="All Data"))
+
+@app.route('/data.json')
+@http_cache.conditional(bol_df_version)
+def data_json():
+    filters = dataset_filters()
+    try:
+        after = int(request.args['after']) if request.args.get('after') else None
+        limit = int(request.args.get('limit', dataset.BATCH_SIZE))
+    except ValueError:
+        abort(400, 'after and limit must be integers')
     conn = get_db_connection()
-    bol_df = read_bol_df()
-    return render_template('dataset.html',  
-                           tables=[bol_df.to_html()], 
-                           titles=bol_df.columns.values,
-                           title="All Data")
+    try:
+        page = dataset.read_page(conn, after=after, limit=limit, **filters)
+    finally:
+        conn.close()
+    if page['next_after'] is not None:
+        page['next_url'] = url_for('data_json', after=page['next_after'], limit=limit,
+                                   **{k: v for k, v in filters.items() if v})
+    return jsonify(page)
+
+@app.route('/db_stats')
+def db_stats():
+    return jsonify(database.get_pool().stats())
 
 @app.route('/top_100_single_sma')
+@http_cache.conditional(leaderboard_version)
 def top_100_single_sma():
-    table = read_top_100_sma()
-    table.set_index('symbol_id', inplace=True)
-
-    link_frmt = lambda x: f'<a href="showLineChart/{x}">{x}</a>'
-    hdr_frmt = f'<th onclick="something"></th>'
-    
+    info = leaderboard_args('single', ['single', 'multi'])
     return render_template('top_100_single_sma.html',
-                           table=table.to_html(formatters={'symbol':link_frmt},
-                                               escape=False,
-                                               index=False),
+                           table=leaderboard_table(info['sort_by'], info['page'], info['per_page']),
+                           pagination=info,
                            title='Top 100 Single SMA')
 
 @app.route('/top_100_exp_ma')
+@http_cache.conditional(leaderboard_version)
 def top_100_exp_ma():
-    table = read_top_100_exp_ma()
-    table.set_index('symbol_id', inplace=True)
-
-    link_frmt = lambda x: f'<a href="showLineChart/{x}">{x}</a>'
-    hdr_frmt = f'<th onclick="something"></th>'
-    
+    info = leaderboard_args('exp_ma', ['exp_ma'])
     return render_template('top_100_exp_ma.html',
-                           table=table.to_html(formatters={'symbol':link_frmt},
-                                               escape=False,
-                                               index=False),
+                           table=leaderboard_table(info['sort_by'], info['page'], info['per_page']),
+                           pagination=info,
                            title='Top 100 Exponential MA')
 
 @app.route('/scrollable')
+@http_cache.conditional(leaderboard_version)
 def scrollable():
-    table = read_top_100_exp_ma()
-    table.set_index('symbol_id', inplace=True)
-    link_frmt = lambda x: f'<a href="showLineChart/{x}">{x}</a>'
+    info = leaderboard_args('exp_ma', ['exp_ma'])
     return render_template('scrollable.html',
-                           table=table.to_html(formatters={'symbol':link_frmt},
-                                               escape=False,
-                                               index=False)
+                           table=leaderboard_table(info['sort_by'], info['page'], info['per_page'])
                            )
+
+@app.route('/leaderboard')
+@http_cache.conditional(leaderboard_version)
+def leaderboard_json():
+    info = leaderboard_args('single', list(leaderboard.SORT_KEYS))
+    table = leaderboard.read_page(info['sort_by'], info['page'], info['per_page'])
+    return jsonify(dict(info, rows=json.loads(table.to_json(orient='records', date_format='iso'))))
+
+@app.route('/leaderboard_stats')
+def leaderboard_stats():
+    return jsonify(leaderboard.cache.stats())
     
 
 
 if __name__ == '__main__':
+    if os.environ.get('STOCK_PAGE_CACHE_WARM'):
+        threading.Thread(target=warm_stock_page_cache, daemon=True).start()
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,95 @@
+"""
+URL keyed store of scraped news articles and their sentiment.
+
+Articles are written by the news ingestion job (news_ingest.py) and read by
+the stock page, so a page view never has to scrape or score an article.
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+ARTICLE_DB = os.environ.get('ARTICLE_DB',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'articles.db'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS articles (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    publisher TEXT,
+    publish_time INTEGER,
+    contents TEXT,
+    summary TEXT,
+    polarity TEXT,
+    fetched_at TEXT
+);
+CREATE TABLE IF NOT EXISTS symbol_articles (
+    symbol TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (symbol, url)
+);
+CREATE INDEX IF NOT EXISTS ix_articles_publish_time ON articles (publish_time);
+'''
+
+
+def get_connection(path=None):
+    """
+    Opens the article store, creating it if needed. WAL mode lets the web
+    workers keep reading while the ingestion job writes.
+    """
+    path = path or ARTICLE_DB
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def known_urls(conn, urls) -> set:
+    """The subset of `urls` that are already stored."""
+    urls = list(urls)
+    found = set()
+    # stay under sqlite's limit on bound parameters
+    for start in range(0, len(urls), 500):
+        chunk = urls[start:start + 500]
+        rows = conn.execute(f"SELECT url FROM articles WHERE url IN ({','.join('?' * len(chunk))})", chunk)
+        found.update(row['url'] for row in rows)
+    return found
+
+
+def save_articles(conn, articles):
+    """
+    Stores processed articles. Each is a dict with url, title, publisher,
+    publish_time, contents, summary and polarity.
+    """
+    fetched_at = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+    with conn:
+        conn.executemany('''
+            INSERT INTO articles (url, title, publisher, publish_time, contents, summary, polarity, fetched_at)
+            VALUES (:url, :title, :publisher, :publish_time, :contents, :summary, :polarity, :fetched_at)
+            ON CONFLICT (url) DO UPDATE SET
+                contents = excluded.contents, summary = excluded.summary,
+                polarity = excluded.polarity, fetched_at = excluded.fetched_at''',
+            [dict(article, polarity=json.dumps(article['polarity']), fetched_at=fetched_at)
+             for article in articles])
+
+
+def link_symbol(conn, symbol, urls):
+    """Records that `urls` showed up in the news for `symbol`."""
+    with conn:
+        conn.executemany('INSERT OR IGNORE INTO symbol_articles (symbol, url) VALUES (?, ?)',
+                         [(symbol.upper(), url) for url in urls])
+
+
+def read_symbol_articles(conn, symbol, limit=10) -> list:
+    """
+    The newest stored articles for a symbol as dicts, with polarity decoded.
+    """
+    rows = conn.execute('''
+        SELECT a.url, a.title, a.publisher, a.publish_time, a.summary, a.polarity
+        FROM symbol_articles s JOIN articles a ON a.url = s.url
+        WHERE s.symbol = ?
+        ORDER BY a.publish_time DESC
+        LIMIT ?''', (symbol.upper(), limit)).fetchall()
+    return [dict(row, polarity=json.loads(row['polarity'])) for row in rows]
@@ -0,0 +1,342 @@
+"""
+Vectorized backtest engine used by the moving average optimizers.
+
+Every helper works on (windows x bars) matrices so that all candidate
+windows for a symbol are evaluated in a handful of numpy operations
+instead of one `iterrows()` pass per window.
+"""
+import numpy as np
+import pandas as pd
+
+# candidate windows used by the single SMA and exponential MA optimizers
+WINDOWS = np.arange(5, 366, 5)
+# candidate windows for each leg of the two SMA crossover optimizer
+PAIR_WINDOWS = np.arange(10, 365, 5)
+
+
+def rolling_mean_matrix(values, windows) -> np.ndarray:
+    """
+    Simple moving averages of `values` for every window in `windows`.
+    Built from one cumulative sum, so each additional window costs a single
+    subtraction. Matches `pd.Series.rolling(n).mean()`: the first n-1 bars,
+    and any window containing a NaN, are NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    windows = np.asarray(windows, dtype=int)
+    n_bars = values.shape[-1]
+
+    valid = ~np.isnan(values)
+    # offset by the first valid value to keep the cumulative sum small
+    offset = values[valid][0] if valid.any() else 0.0
+    csum = np.concatenate(([0.0], np.cumsum(np.where(valid, values - offset, 0.0))))
+    ccount = np.concatenate(([0], np.cumsum(valid)))
+
+    end = np.arange(1, n_bars + 1)
+    start = end[None, :] - windows[:, None]
+    in_range = start >= 0
+    start = np.where(in_range, start, 0)
+
+    sums = csum[end][None, :] - csum[start]
+    counts = ccount[end][None, :] - ccount[start]
+    full = in_range & (counts == windows[:, None])
+    with np.errstate(invalid='ignore'):
+        means = sums / windows[:, None] + offset
+    return np.where(full, means, np.nan)
+
+
+def ema_matrix(values, spans) -> np.ndarray:
+    """
+    Exponential moving averages of `values` for every span in `spans`, in one
+    pass over the bars. Matches `pd.Series.ewm(span=n, adjust=False).mean()`
+    bit for bit, including how NaN bars are carried over.
+    """
+    values = np.asarray(values, dtype=float)
+    spans = np.asarray(spans, dtype=float)
+    # same alpha as pandas, which goes through the center of mass
+    alpha = 1. / (1. + (spans - 1) / 2.)
+    old_wt_factor = 1. - alpha
+
+    out = np.empty((len(values), len(spans)))
+    weighted = np.full(len(spans), values[0] if len(values) else np.nan)
+    old_wt = np.ones(len(spans))
+    started = not np.isnan(weighted[0])
+    out[:1] = weighted
+    for i in range(1, len(values)):
+        cur = values[i]
+        if started:
+            # the old weight keeps decaying across missing bars
+            old_wt *= old_wt_factor
+            if cur == cur:
+                mixed = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                weighted = np.where(weighted != cur, mixed, weighted)
+                old_wt[:] = 1.
+        elif cur == cur:
+            weighted = np.full(len(spans), cur)
+            started = True
+        out[i] = weighted
+    return np.ascontiguousarray(out.T)
+
+
+def last_true_index(mask) -> np.ndarray:
+    """
+    Index of the most recent True bar at or before each bar, -1 if none yet.
+    """
+    bars = np.arange(mask.shape[-1], dtype=np.int32)
+    last = np.where(mask, bars, np.int32(-1))
+    np.maximum.accumulate(last, axis=-1, out=last)
+    return last
+
+
+def position_matrix(enter, exit) -> np.ndarray:
+    """
+    Whether a strategy is holding after each bar.
+    A position opens on the first `enter` bar while flat and closes on the
+    first `exit` bar while holding. `enter` and `exit` must never both be True
+    on the same bar.
+    """
+    return last_true_index(np.asarray(enter, dtype=bool)) > last_true_index(np.asarray(exit, dtype=bool))
+
+
+def trade_multiples(enter, exit, price) -> np.ndarray:
+    """
+    Compounded multiple of capital for every row of an entry/exit matrix.
+    Trades are bought and sold at `price` on the signal bar. Trades still open
+    on the last bar are ignored, and trades with a missing price are skipped,
+    the same as the original row by row backtests.
+    """
+    held = position_matrix(enter, exit)
+    prev = np.zeros_like(held)
+    prev[..., 1:] = held[..., :-1]
+    buys = held & ~prev
+    sells = prev & ~held
+
+    price = np.asarray(price, dtype=float)
+    buy_idx = last_true_index(buys)
+    # only the sell bars need a buy price
+    sell_at = np.nonzero(sells)
+    sell_price = price[sell_at[-1]] if price.ndim == 1 else price[sell_at]
+    buy_at = sell_at[:-1] + (buy_idx[sell_at],)
+    buy_price = price[buy_at[-1]] if price.ndim == 1 else price[buy_at]
+
+    returns = np.ones(held.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[sell_at] = (sell_price - buy_price) / buy_price + 1
+    returns[np.isnan(returns)] = 1.0
+    return returns.prod(axis=-1)
+
+
+def multiples_to_series(windows, multiples, how='multiple') -> pd.Series:
+    """
+    Rounds raw multiples the way the optimizers report them, indexed by window.
+    """
+    if how == 'percentage':
+        values = [round((m - 1) * 100, 3) for m in np.ravel(multiples)]
+    else:
+        values = [round(m, 3) for m in np.ravel(multiples)]
+    return pd.Series(values, index=windows, dtype=float)
+
+
+def best_window(calcs_series):
+    """
+    Returns the (window, multiple) pair with the highest multiple.
+    Ties go to the first window, like `pd.Series.idxmax`.
+    """
+    maxidx = calcs_series.idxmax()
+    maxval = calcs_series.loc[maxidx]
+    return (int(maxidx), maxval)
+
+
+def sma_crossover_multiples(close, price, windows=WINDOWS) -> np.ndarray:
+    """
+    Single SMA strategy for every window: buy when Close rises above its
+    n-day SMA, sell when it falls below.
+    """
+    close = np.asarray(close, dtype=float)
+    sma = rolling_mean_matrix(close, windows)
+    with np.errstate(invalid='ignore'):
+        enter = close > sma
+        exit = close < sma
+    return trade_multiples(enter, exit, price)
+
+
+def ema_crossover_multiples(price, ema) -> np.ndarray:
+    """
+    Exponential MA strategy for every row of `ema`: buy when the EMA rises
+    above price, sell when it falls below.
+    """
+    price = np.asarray(price, dtype=float)
+    with np.errstate(invalid='ignore'):
+        enter = ema > price
+        exit = ema < price
+    return trade_multiples(enter, exit, price)
+
+
+def sma_pair_multiples(close, price, windows=PAIR_WINDOWS, block=8) -> np.ndarray:
+    """
+    Two SMA crossover strategy for every (n, m) pair of windows: buy when the
+    n-day SMA rises above the m-day SMA, sell when it falls below.
+    Every rolling mean is computed once and reused across all pairs. Returns a
+    (windows x windows) matrix of multiples; the diagonal is NaN.
+    `block` first-leg windows are scored at a time to bound memory on long
+    histories.
+    """
+    close = np.asarray(close, dtype=float)
+    sma = rolling_mean_matrix(close, windows)
+    n_windows = len(sma)
+    multiples = np.empty((n_windows, n_windows))
+    for start in range(0, n_windows, block):
+        fast = sma[start:start + block, None, :]
+        with np.errstate(invalid='ignore'):
+            enter = fast > sma[None, :, :]
+            exit = fast < sma[None, :, :]
+        multiples[start:start + block] = trade_multiples(enter, exit, price)
+    np.fill_diagonal(multiples, np.nan)
+    return multiples
+
+
+def multiples_to_frame(windows, multiples) -> pd.DataFrame:
+    """
+    Rounds a pair grid of multiples like `multiples_to_series`, with the first
+    leg's window on the index and the second leg's window on the columns.
+    Pairs that were not scored are 0.
+    """
+    values = np.nan_to_num(np.round(multiples, 3), nan=0.0)
+    return pd.DataFrame(values, index=windows, columns=windows)
+
+
+def best_window_pair(calcs_df):
+    """
+    Returns the ((window_1, window_2), multiple) pair with the highest
+    multiple. Ties go to the first pair in row order.
+    """
+    row, col = np.unravel_index(np.argmax(calcs_df.to_numpy()), calcs_df.shape)
+    maxval = calcs_df.iat[row, col]
+    return ((int(calcs_df.index[row]), int(calcs_df.columns[col])), maxval)
+
+
+def next_true_index(mask) -> np.ndarray:
+    """
+    Index of the first True bar at or after each bar, n_bars if there is none.
+    """
+    n_bars = mask.shape[-1]
+    bars = np.arange(n_bars, dtype=np.int32)
+    nxt = np.where(mask, bars, np.int32(n_bars))[..., ::-1]
+    np.minimum.accumulate(nxt, axis=-1, out=nxt)
+    return nxt[..., ::-1]
+
+
+def _log_return(sell_price, buy_price):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = (sell_price - buy_price) / buy_price + 1
+    returns = np.where(np.isnan(returns), 1.0, returns)
+    with np.errstate(divide='ignore'):
+        return np.log(returns)
+
+
+def slice_multiples(enter, exit, price, slices) -> np.ndarray:
+    """
+    `trade_multiples` for many (start, end) bar slices of the same entry/exit
+    matrix, as if each slice were backtested on its own starting flat, with a
+    trailing axis for the slices.
+
+    Positions and per-trade returns are worked out once over all the bars and
+    turned into a prefix sum of log returns, so each slice costs a couple of
+    gathers. The only trade that differs from a fresh backtest of the slice is
+    one already open at its start: that one is dropped, and the slice's own
+    first buy is scored in its place.
+    """
+    enter = np.asarray(enter, dtype=bool)
+    exit = np.asarray(exit, dtype=bool)
+    price = np.asarray(price, dtype=float)
+    held = position_matrix(enter, exit)
+    prev = np.zeros_like(held)
+    prev[..., 1:] = held[..., :-1]
+    sells = prev & ~held
+    buy_idx = last_true_index(held & ~prev)
+
+    def at(idx):
+        if price.ndim == 1:
+            return price[idx]
+        return np.take_along_axis(np.broadcast_to(price, held.shape), idx, -1)
+
+    log_returns = np.zeros(held.shape)
+    sell_at = np.nonzero(sells)
+    sell_price = price[sell_at[-1]] if price.ndim == 1 else price[sell_at]
+    buy_at = sell_at[:-1] + (buy_idx[sell_at],)
+    buy_price = price[buy_at[-1]] if price.ndim == 1 else price[buy_at]
+    log_returns[sell_at] = _log_return(sell_price, buy_price)
+    prefix = np.zeros(held.shape[:-1] + (held.shape[-1] + 1,))
+    np.cumsum(log_returns, axis=-1, out=prefix[..., 1:])
+
+    starts = np.array([start for start, _ in slices], dtype=np.intp)
+    ends = np.array([end for _, end in slices], dtype=np.intp)
+    total = prefix[..., ends] - prefix[..., starts]
+
+    # a position carried into a slice ends at the slice's first exit
+    n_bars = held.shape[-1]
+    carried = held[..., np.maximum(starts - 1, 0)] & (starts > 0)
+    first_exit = next_true_index(exit)[..., starts]
+    closes = carried & (first_exit < ends)
+    safe_exit = np.minimum(first_exit, n_bars - 1)
+    total -= np.where(closes, np.take_along_axis(log_returns, safe_exit, -1), 0.0)
+    # a fresh backtest of the slice buys on its first entry instead, if that
+    # comes before the exit
+    first_enter = next_true_index(enter)[..., starts]
+    fresh = closes & (first_enter < first_exit)
+    safe_enter = np.minimum(first_enter, n_bars - 1)
+    total += np.where(fresh, _log_return(at(safe_exit), at(safe_enter)), 0.0)
+    return np.exp(total)
+
+
+def fold_slices(n_bars, train_bars, test_bars):
+    """
+    Walk-forward (train, test) bar slices: each fold trains on `train_bars`
+    bars and tests on the `test_bars` bars straight after them, and the next
+    fold moves forward by `test_bars`.
+    """
+    folds = []
+    start = 0
+    while start + train_bars + test_bars <= n_bars:
+        train = (start, start + train_bars)
+        folds.append((train, (train[1], train[1] + test_bars)))
+        start += test_bars
+    return folds
+
+
+def sma_crossover_slice_multiples(close, price, slices, windows=WINDOWS) -> np.ndarray:
+    """`sma_crossover_multiples` for every slice, from one SMA matrix."""
+    close = np.asarray(close, dtype=float)
+    sma = rolling_mean_matrix(close, windows)
+    with np.errstate(invalid='ignore'):
+        enter = close > sma
+        exit = close < sma
+    return slice_multiples(enter, exit, price, slices)
+
+
+def ema_crossover_slice_multiples(price, ema, slices) -> np.ndarray:
+    """`ema_crossover_multiples` for every slice, from one EMA matrix."""
+    price = np.asarray(price, dtype=float)
+    with np.errstate(invalid='ignore'):
+        enter = ema > price
+        exit = ema < price
+    return slice_multiples(enter, exit, price, slices)
+
+
+def sma_pair_slice_multiples(close, price, slices, windows=PAIR_WINDOWS, block=8) -> np.ndarray:
+    """
+    `sma_pair_multiples` for every slice, as a (windows x windows x slices)
+    array with NaN on the diagonal.
+    """
+    close = np.asarray(close, dtype=float)
+    sma = rolling_mean_matrix(close, windows)
+    n_windows = len(sma)
+    multiples = np.empty((n_windows, n_windows, len(slices)))
+    for start in range(0, n_windows, block):
+        fast = sma[start:start + block, None, :]
+        with np.errstate(invalid='ignore'):
+            enter = fast > sma[None, :, :]
+            exit = fast < sma[None, :, :]
+        multiples[start:start + block] = slice_multiples(enter, exit, price, slices)
+    diagonal = np.arange(n_windows)
+    multiples[diagonal, diagonal] = np.nan
+    return multiples
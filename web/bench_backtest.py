@@ -0,0 +1,129 @@
+"""
+Benchmarks the vectorized backtest engine against the original iterrows
+backtests and checks that both pick the same optimum window and multiple.
+Exits with status 1 if any check fails.
+
+Usage: python bench_backtest.py [n_symbols] [n_bars]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import backtest
+from mv_avg_window_optimizer import add_lag_price
+from tests.fixtures import make_history, timed
+from tests.legacy import legacy_exp_ma_backtest, legacy_optimize, legacy_sma_backtest, legacy_two_backtest
+
+
+def vectorized_sma(df):
+    multiples = backtest.sma_crossover_multiples(df.Close, df.price, backtest.WINDOWS)
+    return backtest.best_window(backtest.multiples_to_series(backtest.WINDOWS, multiples))
+
+
+def vectorized_exp_ma(df):
+    ema = backtest.ema_matrix(df['price'], backtest.WINDOWS)
+    multiples = backtest.ema_crossover_multiples(df['price'], ema)
+    return backtest.best_window(backtest.multiples_to_series(backtest.WINDOWS, multiples))
+
+
+def vectorized_pairs(df):
+    multiples = backtest.sma_pair_multiples(df.Close, df.price, backtest.PAIR_WINDOWS)
+    return backtest.multiples_to_frame(backtest.PAIR_WINDOWS, multiples)
+
+
+def compare_pairs(df, seed, n_pairs=10):
+    """
+    The legacy grid takes minutes per symbol, so only a sample of pairs is
+    backtested the old way and the legacy grid time is extrapolated from it.
+    """
+    surface, fast_time = timed(vectorized_pairs, df.copy())
+    rng = np.random.default_rng(seed)
+    pairs = [tuple(rng.choice(backtest.PAIR_WINDOWS, 2, replace=False)) for _ in range(n_pairs)]
+    start = time.perf_counter()
+    mismatches = [(n, m) for n, m in pairs if legacy_two_backtest(df.copy(), n, m) != surface.loc[n, m]]
+    n_grid = len(backtest.PAIR_WINDOWS) * (len(backtest.PAIR_WINDOWS) - 1)
+    legacy_time = (time.perf_counter() - start) / n_pairs * n_grid
+    print(f'symbol {seed}  pairs: legacy ~{legacy_time:8.1f} s   '
+          f'vectorized {fast_time*1000:6.2f} ms  best {backtest.best_window_pair(surface)} '
+          f'{"ok" if not mismatches else f"MISMATCH {mismatches}"}')
+    return not mismatches
+
+
+def compare_ema(df, seed):
+    """
+    Checks the batched EMA kernel against one pandas ewm per span, with a few
+    missing bars punched into the price series.
+    """
+    price = df['price'].to_numpy().copy()
+    price[np.random.default_rng(seed).choice(len(price) - 1, 5, replace=False)] = np.nan
+    price[0] = np.nan
+    expected, pandas_time = timed(lambda: np.vstack([pd.Series(price).ewm(span=n, adjust=False).mean().to_numpy()
+                                                     for n in backtest.WINDOWS]))
+    result, kernel_time = timed(backtest.ema_matrix, price, backtest.WINDOWS)
+    same = np.array_equal(expected, result, equal_nan=True)
+    print(f'symbol {seed}    ema: pandas {pandas_time*1000:8.2f} ms  '
+          f'batched    {kernel_time*1000:6.2f} ms  '
+          f'{"ok" if same else "MISMATCH"}')
+    return same
+
+
+def compare_walk_forward(df, seed, train_bars=126, test_bars=21):
+    """
+    Checks the shared-prefix slice scoring against backtesting every
+    walk-forward slice on its own, and times a pair grid walk-forward against
+    one full-history pair grid.
+    """
+    close, price = df['Close'].to_numpy(), df['price'].to_numpy()
+    slices = [s for fold in backtest.fold_slices(len(df), train_bars, test_bars) for s in fold]
+    if not slices:
+        return True
+    sma = backtest.rolling_mean_matrix(close, backtest.WINDOWS)
+    with np.errstate(invalid='ignore'):
+        enter, exit = close > sma, close < sma
+    expected, naive_time = timed(lambda: np.stack([backtest.trade_multiples(enter[:, a:b], exit[:, a:b], price[a:b])
+                                                   for a, b in slices], -1))
+    result, shared_time = timed(backtest.sma_crossover_slice_multiples, close, price, slices)
+    _, pair_time = timed(backtest.sma_pair_slice_multiples, close, price, slices)
+    _, sweep_time = timed(backtest.sma_pair_multiples, close, price)
+    same = np.allclose(expected, result, rtol=1e-12)
+    print(f'symbol {seed}   walk: {len(slices)//2} folds  per slice {naive_time*1000:6.2f} ms  '
+          f'shared {shared_time*1000:6.2f} ms  '
+          f'{"ok" if same else "MISMATCH"}  '
+          f'pair grid {pair_time*1000:6.1f} ms vs one sweep {sweep_time*1000:6.1f} ms')
+    return same
+
+
+def main(n_symbols=5, n_bars=250):
+    totals = {'legacy': 0.0, 'vectorized': 0.0}
+    failed = []
+    for seed in range(n_symbols):
+        df = add_lag_price(make_history(n_bars, seed))
+        for name, legacy_fn, fast_fn in [('sma', legacy_sma_backtest, vectorized_sma),
+                                         ('exp_ma', legacy_exp_ma_backtest, vectorized_exp_ma)]:
+            expected, legacy_time = timed(legacy_optimize, df.copy(), legacy_fn)
+            result, fast_time = timed(fast_fn, df.copy())
+            totals['legacy'] += legacy_time
+            totals['vectorized'] += fast_time
+            same = expected[0] == result[0] and expected[1] == result[1]
+            print(f'symbol {seed} {name:>6}: legacy {legacy_time*1000:8.1f} ms  '
+                  f'vectorized {fast_time*1000:6.2f} ms  '
+                  f'{expected[0]}/{expected[1]} vs {result[0]}/{result[1]} {"ok" if same else "MISMATCH"}')
+            if not same:
+                failed.append(f'symbol {seed} {name}')
+        for name, compare in [('pairs', compare_pairs), ('ema', compare_ema), ('walk', compare_walk_forward)]:
+            if not compare(df, seed):
+                failed.append(f'symbol {seed} {name}')
+
+    print(f"\nper symbol: legacy {totals['legacy']/n_symbols*1000:.1f} ms, "
+          f"vectorized {totals['vectorized']/n_symbols*1000:.2f} ms, "
+          f"speedup {totals['legacy']/totals['vectorized']:.0f}x")
+    return failed
+
+
+if __name__ == '__main__':
+    failed = main(*[int(arg) for arg in sys.argv[1:3]])
+    if failed:
+        print(f"mismatches: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,63 @@
+"""
+Compares the stock page chart payload sent as Plotly figure JSON with the
+compact typed array payload, with and without LTTB downsampling, and checks
+that the compact series decode back to the same values. Exits with status 1
+if they don't.
+
+Usage: python bench_chart.py [max_points]
+"""
+import json
+import sys
+
+import numpy as np
+import plotly
+
+import chart_payload
+from mv_avg_window_optimizer import Optimized_Symbol
+from tests.fixtures import make_history, timed
+
+WINDOWS = (50, 60, 30, 40)
+
+
+def make_symbol(n_bars, seed=0) -> Optimized_Symbol:
+    """An Optimized_Symbol over a random walk, without touching the database."""
+    opt = object.__new__(Optimized_Symbol)
+    opt.symbol = 'BENCH'
+    opt.history = make_history(n_bars, seed, start='2000-01-03', tz='America/New_York')
+    opt.read_custom_ma_windows = lambda: WINDOWS
+    return opt
+
+
+def check_round_trip(opt, payload) -> bool:
+    ma_df = opt.two_ma_calc(*WINDOWS)
+    days = chart_payload.decode_array(payload['x'])
+    expected_days = chart_payload.epoch_days(ma_df.index)
+    y = chart_payload.decode_array(payload['traces'][1]['y'])
+    return (np.array_equal(days, expected_days)
+            and np.allclose(y, ma_df['single_sma'].to_numpy(), rtol=1e-6, equal_nan=True))
+
+
+def main(max_points=1000):
+    failed = []
+    for years in (1, 5, 20):
+        opt = make_symbol(252 * years)
+        figure_json, figure_time = timed(
+            lambda: json.dumps(opt.plot_custom_ma(), cls=plotly.utils.PlotlyJSONEncoder))
+        full, full_time = timed(lambda: opt.chart_payload())
+        sampled, sampled_time = timed(lambda: opt.chart_payload(max_points))
+        full_json, sampled_json = chart_payload.to_json(full), chart_payload.to_json(sampled)
+        same = check_round_trip(opt, full)
+        if not same:
+            failed.append(f'{years}y')
+        print(f'{years:2d}y {252*years:5d} bars: figure {len(figure_json)/1024:7.1f} KB {figure_time*1000:6.1f} ms | '
+              f'compact {len(full_json)/1024:6.1f} KB {full_time*1000:6.1f} ms | '
+              f'lttb {sampled["points"]} pts {len(sampled_json)/1024:6.1f} KB {sampled_time*1000:6.1f} ms | '
+              f'{"ok" if same else "MISMATCH"}')
+    return failed
+
+
+if __name__ == '__main__':
+    failed = main(*[int(arg) for arg in sys.argv[1:2]])
+    if failed:
+        print(f"round trip mismatches: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
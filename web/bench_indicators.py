@@ -0,0 +1,92 @@
+"""
+Benchmarks the vectorized indicator engine against the original per-symbol
+loops in StockData and checks that both produce the same columns. Also times
+the grouped trend fit against one np.polyfit per symbol. Exits with status 1
+if any check fails.
+
+Usage: python bench_indicators.py [max_legacy_symbols] [n_bars]
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+import indicators
+from tests.fixtures import make_stocks_df, timed
+
+COLUMNS = ['optimum_day_moving_average', 'bolinger_upper_band', 'bolinger_lower_band']
+
+
+def legacy_indicators(df, rolling_window=20):
+    df = df.copy()
+    df.reset_index(inplace=True)
+    for symbol in df['Symbol'].unique():
+        idx_ref_min = min(df[df['Symbol']==symbol].index)
+        idx_ref_max = max(df[df['Symbol']==symbol].index)
+        rolling = df[df['Symbol']==symbol]['Close'].rolling(window=rolling_window)
+        df.loc[idx_ref_min:idx_ref_max+1, 'optimum_day_moving_average'] = rolling.mean()
+    for symbol in df['Symbol'].unique():
+        idx_ref_min = min(df[df['Symbol']==symbol].index)
+        idx_ref_max = max(df[df['Symbol']==symbol].index)
+        standard_dev = df[df['Symbol']==symbol]['optimum_day_moving_average'].rolling(window=rolling_window).std()
+        df.loc[idx_ref_min:idx_ref_max+1, 'bolinger_upper_band'] = \
+            df.loc[idx_ref_min:idx_ref_max+1, 'optimum_day_moving_average'] + standard_dev*2
+        df.loc[idx_ref_min:idx_ref_max+1, 'bolinger_lower_band'] = \
+            df.loc[idx_ref_min:idx_ref_max+1, 'optimum_day_moving_average'] - standard_dev*2
+    df.set_index('Date', inplace=True)
+    return df
+
+
+def vectorized_indicators(df, rolling_window=20):
+    df = df.copy()
+    layout = indicators.group_layout(df['Symbol'])
+    indicators.add_moving_average(df, rolling_window, layout=layout)
+    return indicators.add_bollinger_bands(df, rolling_window=rolling_window, layout=layout)
+
+
+def legacy_trend_slopes(df):
+    slopes = {}
+    for symbol in df['Symbol'].unique():
+        x = np.array([n for n in range(0, len(df[df['Symbol']==symbol]))])
+        y = np.array(df[df['Symbol']==symbol]['Close'])
+        slopes[symbol] = np.polyfit(x, y, 1)[0]
+    return pd.Series(slopes)
+
+
+def vectorized_trend_slopes(df):
+    return indicators.trend_fit(df['Close'], df['Symbol'])['trend_slope']
+
+
+def main(max_legacy_symbols=1000, n_bars=250):
+    failed = []
+    for n_symbols in (100, 1000, 5000):
+        df = make_stocks_df(n_symbols, n_bars)
+        result, fast_time = timed(vectorized_indicators, df)
+        line = f'{n_symbols:5d} symbols: vectorized {fast_time*1000:8.1f} ms'
+        if n_symbols <= max_legacy_symbols:
+            expected, legacy_time = timed(legacy_indicators, df)
+            same = all(np.allclose(expected[col], result[col], equal_nan=True) for col in COLUMNS)
+            line += (f'  legacy {legacy_time*1000:9.1f} ms  speedup {legacy_time/fast_time:6.0f}x  '
+                     f'{"ok" if same else "MISMATCH"}')
+            if not same:
+                failed.append(f'{n_symbols} symbols indicators')
+        print(line)
+
+        result, fast_time = timed(vectorized_trend_slopes, df)
+        line = f'{n_symbols:5d} symbols: trend fit  {fast_time*1000:8.1f} ms'
+        if n_symbols <= max_legacy_symbols:
+            expected, legacy_time = timed(legacy_trend_slopes, df)
+            same = np.allclose(expected.to_numpy(), result.loc[expected.index].to_numpy())
+            line += (f'  polyfit {legacy_time*1000:8.1f} ms  speedup {legacy_time/fast_time:6.0f}x  '
+                     f'{"ok" if same else "MISMATCH"}')
+            if not same:
+                failed.append(f'{n_symbols} symbols trend fit')
+        print(line)
+    return failed
+
+
+if __name__ == '__main__':
+    failed = main(*[int(arg) for arg in sys.argv[1:3]])
+    if failed:
+        print(f"mismatches: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,97 @@
+"""
+Cold start import time of the web worker and the batch jobs.
+
+Each entry point is imported in a fresh interpreter with `-X importtime`, and
+the report lists its total import time plus the packages the repo's own
+modules pull in, slowest first. Lazy imports (the ones inside functions) are
+not counted, since they only load on the code paths that use them.
+
+Usage: python bench_startup.py [module ...] [--repeat N] [--top N] [--budget SECONDS] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ENTRY_POINTS = ('app', 'buy_sell', 'optimization_params_update', 'news_ingest')
+HERE = os.path.dirname(os.path.abspath(__file__))
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def local_modules() -> set:
+    return {name[:-3] for name in os.listdir(HERE) if name.endswith('.py')}
+
+
+def import_times(module) -> list:
+    """(depth, module name, self µs, cumulative µs) for every import `module` makes, in import order."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=HERE, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{proc.stderr[-2000:]}')
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((len(indent) // 2, name, int(own), int(cumulative)))
+    return rows
+
+
+def direct_dependencies(rows, local) -> dict:
+    """
+    Cumulative µs of each package imported directly by a repo module, which
+    is what a lazy import in that module would save.
+    """
+    deps = {}
+    # -X importtime prints a module after its imports, so read it backwards
+    # to see every parent before its children
+    stack = []
+    for depth, name, _, cumulative in reversed(rows):
+        del stack[depth:]
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        if parent in local and name.split('.')[0] not in local:
+            root = name.split('.')[0]
+            deps[root] = max(deps.get(root, 0), cumulative)
+    return deps
+
+
+def report(module, repeat=3, top=10) -> dict:
+    local = local_modules()
+    best = None
+    for _ in range(repeat):
+        rows = import_times(module)
+        total = next(cumulative for depth, name, _, cumulative in rows if depth == 0 and name == module)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total, rows = best
+    deps = sorted(direct_dependencies(rows, local).items(), key=lambda item: -item[1])
+    return dict(module=module, seconds=total / 1e6, modules_loaded=len(rows),
+                dependencies={name: us / 1e6 for name, us in deps[:top]})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time of the app and batch entry points')
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS)
+    parser.add_argument('--repeat', type=int, default=3, help='imports per module; the fastest is kept')
+    parser.add_argument('--top', type=int, default=10, help='dependencies to list per module')
+    parser.add_argument('--budget', type=float, help='exit with status 1 if any module takes longer (seconds)')
+    parser.add_argument('--json', action='store_true', help='print one JSON object per module')
+    args = parser.parse_args()
+
+    results = [report(module, args.repeat, args.top) for module in args.modules]
+    for result in results:
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(f"{result['module']:<28} {result['seconds']:7.3f}s  ({result['modules_loaded']} modules)")
+        for name, seconds in result['dependencies'].items():
+            print(f'    {name:<24} {seconds:7.3f}s')
+
+    if args.budget is not None:
+        slow = [r['module'] for r in results if r['seconds'] > args.budget]
+        if slow:
+            print(f"over the {args.budget}s budget: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
@@ -1,24 +1,22 @@
-from mv_avg_window_optimizer import Optimized_Symbol, add_lag_price
+from indicator_state import IndicatorState, SMA, EXP_MA, advance_states, read_states, write_states
 
-import pandas as pd
 import numpy as np
 
-import yfinance as yf
+import price_store
 
-import psycopg2
-
-from tqdm import tqdm
+import database
 
 from datetime import date
+import argparse
+
+# enough recent bars to cover weekends and holidays between daily runs
+RECENT_PERIOD = '1mo'
 
 def create_db_connection():
-    conn = psycopg2.connect("dbname=stock_app user=stock_app password=stock_app_pi")
-    cur = conn.cursor()
-    return conn, cur
+    return database.create_db_connection()
 
 def close_db_connection(conn, cur):
-    cur.close()
-    conn.close()
+    database.close_db_connection(conn, cur)
 
 def get_symbol_optimum_multiple(symbol):
     conn, cur = create_db_connection()
@@ -47,29 +45,32 @@ def get_symbol_optimum_window(opt_mult, symbol):
     close_db_connection(conn, cur)
     return optimum_window
 
-def calc_ma_price(how, symbol) -> pd.DataFrame:
+def calc_ma_price(how, symbol, state=None):
+    """
+    Brings the symbol's stored indicator state up to date with the bars since
+    its last run and returns it. The state is rebuilt from a year of history
+    when there isn't one yet, when the optimum strategy or window changed, when
+    the run has fallen too far behind, or when the prices were re-adjusted for
+    a split or dividend since.
+    """
     try:
-        ticker = yf.Ticker(f'{symbol}')
-        history = ticker.history(period='12mo')
-        # current_price = yf.Ticker(symbol).basic_info['lastPrice']
-        ma_df = add_lag_price(history)
         optimum_window = get_symbol_optimum_window(how, symbol)
-        if how == 'single_param_optimum_multiple':
-            ma_df['single_sma'] = ma_df.price.rolling(optimum_window).mean()
-            ma_df['position'] = np.where(ma_df['price'] > ma_df['single_sma'], 'buy', 'sell')
-                
-        elif how == 'exp_ma_optimum_multiple':
-            ma_df['exp_ma'] = ma_df.price.ewm(span=optimum_window, adjust=False).mean()
-            ma_df['position'] = np.where(ma_df['price'] > ma_df['exp_ma'], 'buy', 'sell')
-            
-        # check if position today has changed from the previous day
-        changed_from_yesterday = True if ma_df['position'].iloc[-1] != ma_df['position'].iloc[-2] else False
-        return [ma_df['position'].iloc[-2], ma_df['price'].iloc[-2], changed_from_yesterday]
+        if state is not None and state.matches(how, optimum_window) and state.last_date is not None:
+            bars = price_store.get_history(symbol, RECENT_PERIOD)
+            last_open = bars['Open'][bars.index.date == state.last_date] if not bars.empty else bars
+            if len(last_open) and state.matches_price(last_open.iloc[-1]):
+                for day, price in bars['Open'][bars.index.date > state.last_date].items():
+                    state.update(price, day.date())
+                return state
+        history = price_store.get_history(symbol, '12mo')
+        return IndicatorState.rebuild(symbol, how, optimum_window,
+                                      history['Open'], history.index.date)
     except Exception as e:
         print(e)
 
-def update_positions(symbol, position):
-    if position != None:
+def update_positions(symbol, state):
+    if state != None:
+        position = [state.position, state.at_price, state.changed_from_yesterday]
         conn, cur = create_db_connection()
         query = f"""INSERT INTO positions (position, symbol, date, at_price, changed_from_yesterday)
         VALUES  ('{position[0]}', '{symbol}', '{date.today()}', '{position[1]}', '{position[2]}');
@@ -81,22 +82,153 @@ def update_positions(symbol, position):
         print(f'Failed to update on {symbol}')
     
 
-conn, cur = create_db_connection()
-# get the current list of all symbols in the db
-cur.execute("SELECT symbol FROM optimum_symbol_parameters;")
-symbol_list = [val[0] for idx, val in enumerate(cur.fetchall())]
-close_db_connection(conn, cur)
+def get_optimum_strategies() -> dict:
+    """
+    Every symbol's best strategy and its window from one query, as
+    {symbol: (strategy, window)}. Picks the strategy the same way as
+    get_symbol_optimum_multiple and leaves out symbols without a window.
+    """
+    with database.get_pool().cursor() as cur:
+        cur.execute("""SELECT symbol, single_param_optimum_multiple, exp_ma_optimum_multiple,
+            single_param_optimum_window, exp_ma_optimum_window
+        FROM optimum_symbol_parameters;""")
+        rows = cur.fetchall()
+    strategies = {}
+    for symbol, single_mult, exp_mult, single_window, exp_window in rows:
+        single_mult = 0 if single_mult is None else single_mult
+        exp_mult = 0 if exp_mult is None else exp_mult
+        if exp_mult > single_mult:
+            strategies[symbol] = (EXP_MA, exp_window)
+        else:
+            strategies[symbol] = (SMA, single_window)
+    return {symbol: opt for symbol, opt in strategies.items() if opt[1] is not None}
+
+def price_rows(stacked, symbols, after=None):
+    """
+    Each symbol's Open prices and bar dates from a load_histories frame, as
+    lists in `symbols` order. With `after`, only bars after after[symbol].
+    """
+    by_symbol = {}
+    if not stacked.empty:
+        for symbol, history in stacked['Open'].groupby(level='Symbol', sort=False):
+            by_symbol[symbol] = history.droplevel('Symbol')
+    prices, dates = [], []
+    for symbol in symbols:
+        history = by_symbol.get(symbol)
+        if history is None:
+            prices.append(np.array([])), dates.append([])
+            continue
+        days = history.index.date
+        if after is not None:
+            history, days = history[days > after[symbol]], days[days > after[symbol]]
+        prices.append(history.to_numpy(dtype=float)), dates.append(list(days))
+    return prices, dates
+
+def prices_on(stacked, days) -> dict:
+    """
+    Each symbol's Open price on the date days[symbol] from a load_histories
+    frame, leaving out symbols without a bar on that date.
+    """
+    found = {}
+    if stacked.empty:
+        return found
+    for symbol, history in stacked['Open'].groupby(level='Symbol', sort=False):
+        if symbol in days:
+            history = history.droplevel('Symbol')
+            on_day = history[history.index.date == days[symbol]]
+            if len(on_day):
+                found[symbol] = on_day.iloc[-1]
+    return found
+
+def pad(rows) -> np.ndarray:
+    """Ragged price lists as one NaN padded matrix."""
+    matrix = np.full((len(rows), max((len(row) for row in rows), default=0)), np.nan)
+    for i, row in enumerate(rows):
+        matrix[i, :len(row)] = row
+    return matrix
+
+def write_positions(cur, states):
+    """Today's positions for many symbols in one multi-row insert."""
+    from psycopg2.extras import execute_values
+    today = date.today()
+    values = [(state.position, state.symbol, today, state.at_price, state.changed_from_yesterday)
+              for state in states]
+    execute_values(cur, """INSERT INTO positions (position, symbol, date, at_price, changed_from_yesterday)
+        VALUES %s;""", values, page_size=max(len(values), 1))
+
+def run_batched(workers=16):
+    """
+    Updates every symbol's position with a handful of bulk operations: one
+    query for the optimum strategies, one for the stored states, bulk price
+    loads, one array pass over all states and one transaction for the writes.
+    """
+    strategies = get_optimum_strategies()
+    stored = read_states(strategies)
+
+    current = [s for s, (how, window) in strategies.items()
+               if s in stored and stored[s].matches(how, window) and stored[s].last_date is not None]
+    recent = price_store.load_histories(current, RECENT_PERIOD, workers=workers)
+    # a state that fell behind the recent bars, or was built on prices that
+    # have since been re-adjusted for a split or dividend, has to be rebuilt
+    last_open = prices_on(recent, {s: stored[s].last_date for s in current})
+    current = [s for s in current if s in last_open and stored[s].matches_price(last_open[s])]
+    current_set = set(current)
+    rebuild = [s for s in strategies if s not in current_set]
+
+    states = [stored[s] for s in current]
+    prices, dates = price_rows(recent, current, {s: stored[s].last_date for s in current})
+
+    history = price_store.load_histories(rebuild, '12mo', workers=workers)
+    rebuilt_prices, rebuilt_dates = price_rows(history, rebuild)
+    rebuilt = [(symbol, row, days) for symbol, row, days in zip(rebuild, rebuilt_prices, rebuilt_dates)
+               if len(row)]
+    for symbol in set(rebuild) - {symbol for symbol, _, _ in rebuilt}:
+        print(f'Failed to update on {symbol}')
+    states += [IndicatorState(symbol, *strategies[symbol]) for symbol, _, _ in rebuilt]
+    prices += [row for _, row, _ in rebuilt]
+    dates += [days for _, _, days in rebuilt]
+
+    advance_states(states, pad(prices), dates)
+    states = [state for state in states if state.position is not None]
+    with database.get_pool().cursor(commit=True) as cur:
+        write_positions(cur, states)
+        write_states(states, cur)
+    print(f'Updated positions for {len(states)} of {len(strategies)} symbols')
+
+def run_per_symbol():
+    conn, cur = create_db_connection()
+    # get the current list of all symbols in the db
+    cur.execute("SELECT symbol FROM optimum_symbol_parameters;")
+    symbol_list = [val[0] for idx, val in enumerate(cur.fetchall())]
+    close_db_connection(conn, cur)
+
+    states = read_states()
+    updated_states = []
 
-# for a given stock
-#for symbol in tqdm(symbol_list):
-for symbol in symbol_list:
-    # find the historical best moving average performance and it's value
-    opt_param = get_symbol_optimum_multiple(symbol)
+    # for a given stock
+    #for symbol in tqdm(symbol_list):
+    for symbol in symbol_list:
+        # find the historical best moving average performance and it's value
+        opt_param = get_symbol_optimum_multiple(symbol)
 
-    # calculate the optimum ma price for today
-    position = calc_ma_price(opt_param, symbol)
+        # calculate the optimum ma price for today
+        state = calc_ma_price(opt_param, symbol, states.get(symbol))
 
-    update_positions(symbol, position)
+        update_positions(symbol, state)
+        if state is not None:
+            updated_states.append(state)
 
+    write_states(updated_states)
 
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record today's moving average position for every optimized symbol")
+    parser.add_argument('--per-symbol', action='store_true',
+                        help='update one symbol at a time instead of in bulk')
+    parser.add_argument('-w', '--workers', type=int, default=16, help='concurrent price downloads')
+    args = parser.parse_args()
+
+    if args.per_symbol:
+        run_per_symbol()
+    else:
+        run_batched(args.workers)
@@ -0,0 +1,96 @@
+"""
+In-memory cache with a time to live and least recently used eviction,
+bounded by the approximate size of the cached values.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def approx_size(value) -> int:
+    """Rough size in bytes of strings, numbers and the containers holding them."""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(approx_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class TTLCache:
+    """
+    Thread safe mapping of key -> value where entries expire after `ttl`
+    seconds and the least recently used entries are evicted once the cached
+    values add up to more than `max_bytes`.
+    """
+    def __init__(self, ttl, max_bytes, sizeof=approx_size):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = dict(hits=0, misses=0, evictions=0, expirations=0)
+
+    def _drop(self, key):
+        expires, size, value = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return default
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                self.counters['expirations'] += 1
+                self.counters['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[2]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def get_or_set(self, key, build):
+        """
+        Returns the cached value for `key`, or calls `build()` and caches its
+        result. `build` returns (value, cacheable) so failures aren't kept.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value, cacheable = build()
+            if cacheable:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, match):
+        """Drops every entry whose key `match(key)` accepts."""
+        with self._lock:
+            for key in [k for k in self._entries if match(k)]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes,
+                        max_bytes=self.max_bytes, ttl=self.ttl)
@@ -0,0 +1,89 @@
+"""
+Compact chart payloads for the stock page.
+
+A Plotly figure serialized with PlotlyJSONEncoder repeats the date axis in
+every trace and writes every price as decimal text. The payload built here
+sends the date axis once as int32 day numbers and each series as base64
+float32, optionally downsampled with LTTB first. The script in
+templates/stock_page.html turns it back into Plotly traces in the browser.
+"""
+import base64
+import json
+
+import numpy as np
+import pandas as pd
+
+DTYPES = {'f4': np.float32, 'i4': np.int32, 'i1': np.int8}
+
+
+def encode_array(values, dtype='f4') -> dict:
+    """A little endian typed array as {'dtype', 'bdata'} with base64 data."""
+    array = np.ascontiguousarray(values, dtype=np.dtype(DTYPES[dtype]).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def decode_array(encoded) -> np.ndarray:
+    dtype = np.dtype(DTYPES[encoded['dtype']]).newbyteorder('<')
+    return np.frombuffer(base64.b64decode(encoded['bdata']), dtype=dtype)
+
+
+def epoch_days(index) -> np.ndarray:
+    """Calendar dates of a DatetimeIndex as days since 1970-01-01."""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.normalize().to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def lttb(x, y, threshold) -> np.ndarray:
+    """
+    Indices of the `threshold` points Largest-Triangle-Three-Buckets keeps
+    from (x, y): the first and last points, plus the point in each bucket
+    that makes the largest triangle with the previous pick and the next
+    bucket's average. Returns every index if there are no more points than
+    `threshold`.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold is None or threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    picked = np.empty(threshold, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = np.nanmean(y[next_start:next_end]) if not np.isnan(y[next_start:next_end]).all() else y[a]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        area = np.where(np.isnan(area), -1.0, area)
+        a = start + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def build_payload(index, traces, layout=None, max_points=None, key=None) -> dict:
+    """
+    Chart payload for traces that share one date axis. Each trace is a dict
+    with 'name', 'y' and optionally 'mode' and 'marker_color'. With
+    `max_points`, the points are picked with LTTB on the `key` trace (the
+    first one by default) and the same points are kept in every trace.
+    """
+    days = epoch_days(index)
+    key_y = traces[0]['y'] if key is None else next(t['y'] for t in traces if t['name'] == key)
+    keep = lttb(days, key_y, max_points)
+    encoded = []
+    for trace in traces:
+        item = {'name': trace['name'], 'mode': trace.get('mode', 'lines'),
+                'y': encode_array(np.asarray(trace['y'], dtype=float)[keep])}
+        if trace.get('marker_color') is not None:
+            item['marker_color'] = encode_array(np.asarray(trace['marker_color'])[keep], 'i1')
+        encoded.append(item)
+    return {'x': encode_array(days[keep], 'i4'), 'traces': encoded, 'layout': layout or {},
+            'points': len(keep), 'source_points': len(days)}
+
+
+def to_json(payload) -> str:
+    return json.dumps(payload, separators=(',', ':'))
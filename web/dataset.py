@@ -0,0 +1,104 @@
+"""
+Filtered, batched reads of the `bol_df` table for the /data views.
+
+Rows are read with a cursor in batches instead of loading the whole table
+into a DataFrame, and pages are keyed on rowid so any page costs the same
+as the first one.
+"""
+import sqlite3
+from datetime import datetime
+
+TABLE = 'bol_df'
+BATCH_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def ensure_indexes(conn):
+    """
+    Indexes the symbol and date filters use. `to_sql(if_exists='replace')`
+    drops them, so this runs after every rebuild.
+    """
+    with conn:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{TABLE}_Symbol_Date ON {TABLE} ("Symbol", "Date")')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{TABLE}_Date ON {TABLE} ("Date")')
+
+
+def columns(conn) -> list:
+    """The table's column names, or [] before the first rebuild."""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({TABLE})')]
+
+
+def _where(symbol=None, start=None, end=None, after=None):
+    clauses, params = [], []
+    if symbol:
+        clauses.append('"Symbol" = ?')
+        params.append(symbol.upper())
+    if start:
+        clauses.append('"Date" >= ?')
+        params.append(start)
+    if end:
+        # dates are stored with a time, so include the whole end day
+        clauses.append('"Date" < date(?, \'+1 day\')')
+        params.append(end)
+    if after is not None:
+        clauses.append('rowid > ?')
+        params.append(int(after))
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def iter_rows(conn, symbol=None, start=None, end=None, after=None, limit=None, batch_size=BATCH_SIZE):
+    """
+    Yields (rowid, row) for the rows matching the filters, in table order,
+    fetching `batch_size` rows at a time. `after` skips to the rows past a
+    rowid returned earlier.
+    """
+    where, params = _where(symbol, start, end, after)
+    query = f'SELECT rowid, * FROM {TABLE}{where} ORDER BY rowid'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+    cur = conn.execute(query, params)
+    try:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], tuple(row[1:])
+    finally:
+        cur.close()
+
+
+def read_page(conn, symbol=None, start=None, end=None, after=None, limit=BATCH_SIZE) -> dict:
+    """
+    One page of rows as {'columns', 'rows', 'next_after'}; pass `next_after`
+    back as `after` for the next page. It is None on the last page.
+    """
+    limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+    cols = columns(conn)
+    if not cols:
+        return dict(columns=[], rows=[], next_after=None)
+    # one extra row tells whether there is another page
+    page = list(iter_rows(conn, symbol, start, end, after, limit + 1))
+    rows = [row for _, row in page[:limit]]
+    next_after = page[limit - 1][0] if len(page) > limit else None
+    return dict(columns=cols, rows=rows, next_after=next_after)
+
+
+def record_version(conn, *names):
+    """Marks the named tables as rewritten now, for the pages' cache validators."""
+    now = datetime.now().isoformat()
+    with conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, updated_at TEXT)')
+        conn.executemany('INSERT OR REPLACE INTO data_versions (name, updated_at) VALUES (?, ?)',
+                         [(name, now) for name in names])
+
+
+def read_version(conn, name):
+    """When the named table was last rewritten, as an ISO string, or None."""
+    try:
+        row = conn.execute('SELECT updated_at FROM data_versions WHERE name = ?', (name,)).fetchone()
+    except sqlite3.OperationalError:
+        # nothing has been rebuilt since data_versions was added
+        return None
+    return row[0] if row else None
@@ -0,0 +1,17 @@
+--
+-- Adds the unique constraint on optimum_symbol_parameters.symbol that the
+-- bulk upsert in mv_avg_window_optimizer.upsert_optimum_params relies on.
+-- Duplicate rows for a symbol are removed first, keeping the newest one.
+--
+
+BEGIN;
+
+DELETE FROM public.optimum_symbol_parameters older
+USING public.optimum_symbol_parameters newer
+WHERE older.symbol = newer.symbol
+  AND older.symbol_id < newer.symbol_id;
+
+ALTER TABLE ONLY public.optimum_symbol_parameters
+    ADD CONSTRAINT optimum_symbol_parameters_symbol_key UNIQUE (symbol);
+
+COMMIT;
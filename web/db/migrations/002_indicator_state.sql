@@ -0,0 +1,27 @@
+--
+-- Adds the per-symbol running indicator state used by buy_sell.py so the
+-- daily job can update each symbol from its newest bar instead of
+-- recomputing a year of moving averages.
+--
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.indicator_state (
+    symbol character varying NOT NULL,
+    strategy character varying NOT NULL,
+    ma_window integer NOT NULL,
+    last_date date,
+    ema double precision,
+    buffer double precision[],
+    buffer_sum double precision,
+    buffer_head integer,
+    buffer_count integer,
+    position character varying,
+    at_price double precision,
+    changed_from_yesterday boolean,
+    CONSTRAINT indicator_state_pkey PRIMARY KEY (symbol)
+);
+
+ALTER TABLE public.indicator_state OWNER TO stock_app;
+
+COMMIT;
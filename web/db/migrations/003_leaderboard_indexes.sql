@@ -0,0 +1,18 @@
+--
+-- Sort indexes for the leaderboard pages (leaderboard.py). Each one covers
+-- a single ranking, `ORDER BY <multiple> DESC, symbol_id` over the rows
+-- that have that multiple, so a page is an index range scan no matter how
+-- many symbols are stored.
+--
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_optimum_symbol_parameters_single_rank
+    ON public.optimum_symbol_parameters (single_param_optimum_multiple DESC, symbol_id)
+    WHERE single_param_optimum_multiple IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_optimum_symbol_parameters_multi_rank
+    ON public.optimum_symbol_parameters (multi_param_optimum_multiple DESC, symbol_id)
+    WHERE multi_param_optimum_multiple IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_optimum_symbol_parameters_exp_ma_rank
+    ON public.optimum_symbol_parameters (exp_ma_optimum_multiple DESC, symbol_id)
+    WHERE exp_ma_optimum_multiple IS NOT NULL;
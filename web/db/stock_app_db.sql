@@ -29,6 +29,29 @@ SET default_tablespace = '';
 
 SET default_table_access_method = heap;
 
+--
+-- Name: indicator_state; Type: TABLE; Schema: public; Owner: stock_app
+--
+
+CREATE TABLE public.indicator_state (
+    symbol character varying NOT NULL,
+    strategy character varying NOT NULL,
+    ma_window integer NOT NULL,
+    last_date date,
+    ema double precision,
+    buffer double precision[],
+    buffer_sum double precision,
+    buffer_head integer,
+    buffer_count integer,
+    position character varying,
+    at_price double precision,
+    changed_from_yesterday boolean,
+    CONSTRAINT indicator_state_pkey PRIMARY KEY (symbol)
+);
+
+
+ALTER TABLE public.indicator_state OWNER TO stock_app;
+
 --
 -- Name: optimum_symbol_parameters; Type: TABLE; Schema: public; Owner: stock_app
 --
@@ -129,6 +152,35 @@ ALTER TABLE public.symbol_info OWNER TO stock_app;
 ALTER TABLE ONLY public.optimum_symbol_parameters ALTER COLUMN symbol_id SET DEFAULT nextval('public.optimum_symbol_parameters_symbol_id_seq'::regclass);
 
 
+--
+-- Name: optimum_symbol_parameters optimum_symbol_parameters_symbol_key; Type: CONSTRAINT; Schema: public; Owner: stock_app
+--
+
+ALTER TABLE ONLY public.optimum_symbol_parameters
+    ADD CONSTRAINT optimum_symbol_parameters_symbol_key UNIQUE (symbol);
+
+
+--
+-- Name: ix_optimum_symbol_parameters_single_rank; Type: INDEX; Schema: public; Owner: stock_app
+--
+
+CREATE INDEX ix_optimum_symbol_parameters_single_rank ON public.optimum_symbol_parameters USING btree (single_param_optimum_multiple DESC, symbol_id) WHERE (single_param_optimum_multiple IS NOT NULL);
+
+
+--
+-- Name: ix_optimum_symbol_parameters_multi_rank; Type: INDEX; Schema: public; Owner: stock_app
+--
+
+CREATE INDEX ix_optimum_symbol_parameters_multi_rank ON public.optimum_symbol_parameters USING btree (multi_param_optimum_multiple DESC, symbol_id) WHERE (multi_param_optimum_multiple IS NOT NULL);
+
+
+--
+-- Name: ix_optimum_symbol_parameters_exp_ma_rank; Type: INDEX; Schema: public; Owner: stock_app
+--
+
+CREATE INDEX ix_optimum_symbol_parameters_exp_ma_rank ON public.optimum_symbol_parameters USING btree (exp_ma_optimum_multiple DESC, symbol_id) WHERE (exp_ma_optimum_multiple IS NOT NULL);
+
+
 --
 -- Name: ix_price_data_Date; Type: INDEX; Schema: public; Owner: stock_app
 --
@@ -0,0 +1,60 @@
+"""
+gunicorn settings for serving the app: `gunicorn -c gunicorn.conf.py`.
+
+Threaded workers, one per core by default, forked from a master that has
+already imported and warmed the app (see wsgi.py). Every setting can be
+overridden with the environment variable next to it.
+"""
+import os
+import tempfile
+
+# every worker writes its metrics here for /metrics to add up (see metrics.py);
+# one directory per server, since this file is read by the master
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'stock_app_metrics_{os.getpid()}'))
+
+wsgi_app = 'wsgi:application'
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# processes for the numpy and pandas work, threads for requests waiting on
+# Yahoo, Postgres or article downloads
+workers = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# import the app once in the master, so workers share it and start warm
+preload_app = True
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+# recycling a worker after this many requests is off by default: the
+# background jobs (see jobs.py) run on threads inside the workers, and a
+# recycled worker would cut a running refresh or optimization short
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 0))
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    import metrics
+    import wsgi
+    metrics.clear()
+    wsgi.preload(warm_pages=bool(os.environ.get('STOCK_PAGE_CACHE_WARM')))
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.post_fork()
+
+
+def worker_exit(server, worker):
+    import metrics
+    metrics.flush()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.archive(worker.pid)
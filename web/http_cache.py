@@ -0,0 +1,174 @@
+"""
+Response compression and conditional GET for the data heavy pages.
+
+`init_app` compresses text responses with brotli when the client accepts it
+and the `brotli` package is installed, and with gzip otherwise. Streamed
+responses are compressed chunk by chunk.
+
+`conditional` gives a view an ETag and Last-Modified derived from the data
+it shows, and answers 304 before the view runs when the client's copy is
+still current.
+"""
+import functools
+import gzip
+import hashlib
+import os
+import zlib
+from datetime import datetime, timezone
+
+from flask import request, make_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+COMPRESS_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/javascript',
+                      'application/javascript', 'application/json'}
+
+
+def _release():
+    # changes with every deploy, so new templates or code never match an old ETag
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.join(here, name) for name in os.listdir(here) if name.endswith('.py')]
+    templates = os.path.join(here, 'templates')
+    if os.path.isdir(templates):
+        paths += [os.path.join(templates, name) for name in os.listdir(templates)]
+    return str(max((os.path.getmtime(path) for path in paths), default=0))
+
+
+RELEASE = os.environ.get('APP_RELEASE') or _release()
+
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(COMPRESS_LEVEL, 11))
+        for chunk in chunks:
+            chunk = chunk.encode() if isinstance(chunk, str) else chunk
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            chunk = chunk.encode() if isinstance(chunk, str) else chunk
+            # sync flush so the browser can start rendering every chunk it gets
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def compress_response(response):
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        if encoding == 'br':
+            data = brotli.compress(data, quality=min(COMPRESS_LEVEL, 11))
+        else:
+            data = gzip.compress(data, COMPRESS_LEVEL)
+        response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    if response.headers.get('ETag'):
+        # the compressed body is a different representation of the same page
+        response.set_etag(response.get_etag()[0] + f'-{encoding}', weak=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
+
+
+def validators(parts, last_modified=None):
+    """
+    (etag, last_modified) for a page built from `parts`, which should change
+    whenever the data shown on the page does. The URL and query string are
+    part of the tag.
+    """
+    digest = hashlib.sha1(repr((RELEASE, request.full_path, parts)).encode()).hexdigest()
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.astimezone()
+        last_modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+    return digest, last_modified
+
+
+def is_fresh(etag, last_modified):
+    """Whether the client's cached copy still matches."""
+    if request.if_none_match:
+        # compare against the tag with or without an encoding suffix
+        return any(tag.split('-')[0] == etag for tag in request.if_none_match.as_set(include_weak=True))
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # revalidate on every use so a new sweep shows up straight away
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified):
+    return set_validators(make_response('', 304), etag, last_modified)
+
+
+def conditional(version):
+    """
+    Decorates a view with ETag and Last-Modified headers from
+    `version(**view_args)`, which returns (parts, last_modified datetime or
+    None). When the client's copy is current the view isn't called at all and
+    the response is a 304.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            parts, last_modified = version(*args, **kwargs)
+            etag, last_modified = validators(parts, last_modified)
+            if is_fresh(etag, last_modified):
+                return not_modified(etag, last_modified)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def parse_timestamp(value):
+    """A datetime from the ISO strings the app stores, or None."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
@@ -0,0 +1,225 @@
+"""
+Running moving average and position state for the daily buy_sell job.
+
+Each symbol keeps its running EMA, a ring buffer holding the last `window`
+prices for the SMA and its last position in the `indicator_state` table. A new
+day's price updates that state in constant time, so the job only needs the
+bars since its last run instead of recomputing a year of history. The state
+is rebuilt from history whenever the symbol's optimum strategy or window
+changes, or the price store has re-adjusted the prices it was built on.
+"""
+import math
+
+import numpy as np
+
+import database
+from price_store import ADJUSTMENT_TOLERANCE
+
+SMA = 'single_param_optimum_multiple'
+EXP_MA = 'exp_ma_optimum_multiple'
+
+STATE_COLUMNS = ['symbol', 'strategy', 'ma_window', 'last_date', 'ema', 'buffer',
+                 'buffer_sum', 'buffer_head', 'buffer_count', 'position', 'at_price',
+                 'changed_from_yesterday']
+
+
+class IndicatorState:
+    def __init__(self, symbol, strategy, ma_window, last_date=None, ema=None, buffer=None,
+                 buffer_sum=0.0, buffer_head=0, buffer_count=0, position=None,
+                 at_price=None, changed_from_yesterday=False):
+        if strategy not in (SMA, EXP_MA):
+            raise ValueError(f'Unknown strategy {strategy}')
+        self.symbol = symbol
+        self.strategy = strategy
+        self.ma_window = int(ma_window)
+        self.last_date = last_date
+        self.ema = ema
+        self.buffer = list(buffer) if buffer is not None else [0.0] * self.ma_window
+        self.buffer_sum = buffer_sum
+        self.buffer_head = buffer_head
+        self.buffer_count = buffer_count
+        self.position = position
+        self.at_price = at_price
+        self.changed_from_yesterday = changed_from_yesterday
+        # same alpha as pandas ewm(span=window), which goes through the center of mass
+        self.alpha = 1. / (1. + (self.ma_window - 1) / 2.)
+
+    @classmethod
+    def rebuild(cls, symbol, strategy, window, prices, dates):
+        """Fresh state for `strategy` and `window` run over a price history."""
+        state = cls(symbol, strategy, window)
+        for price, day in zip(prices, dates):
+            state.update(price, day)
+        return state
+
+    def matches(self, strategy, window) -> bool:
+        """Whether this state was built for the symbol's current optimum."""
+        return self.strategy == strategy and self.ma_window == int(window)
+
+    def matches_price(self, price) -> bool:
+        """
+        Whether `price`, the symbol's stored price on `last_date`, is still the
+        one this state last took. After a split or dividend the price store
+        re-downloads adjusted history, and a state built on the old prices
+        would mix them with the new ones.
+        """
+        if self.at_price is None or price is None or price != price:
+            return False
+        return math.isclose(float(price), self.at_price, rel_tol=ADJUSTMENT_TOLERANCE)
+
+    @property
+    def moving_average(self):
+        if self.strategy == EXP_MA:
+            return self.ema
+        if self.buffer_count < self.ma_window:
+            return math.nan
+        return self.buffer_sum / self.ma_window
+
+    def _update_ema(self, price):
+        if self.ema is None:
+            self.ema = price
+            return
+        # the pandas adjust=False recurrence written the same way as
+        # backtest.ema_matrix, so both give the same bits
+        old_wt = 1. - self.alpha
+        if self.ema != price:
+            self.ema = (old_wt * self.ema + self.alpha * price) / (old_wt + self.alpha)
+
+    def _update_sma(self, price):
+        head = self.buffer_head
+        if self.buffer_count == self.ma_window:
+            self.buffer_sum -= self.buffer[head]
+        else:
+            self.buffer_count += 1
+        self.buffer[head] = price
+        self.buffer_sum += price
+        self.buffer_head = (head + 1) % self.ma_window
+        if self.buffer_head == 0:
+            # re-add the buffer once per lap so the running sum doesn't drift
+            self.buffer_sum = math.fsum(self.buffer[:self.buffer_count])
+
+    def update(self, price, day):
+        """
+        Takes the next bar's price. Missing prices are skipped and leave the
+        state as it was.
+        """
+        if price is None or price != price:
+            return self
+        price = float(price)
+        self._update_ema(price)
+        self._update_sma(price)
+        position = 'buy' if price > self.moving_average else 'sell'
+        self.changed_from_yesterday = self.position is not None and position != self.position
+        self.position = position
+        self.at_price = price
+        self.last_date = day
+        return self
+
+    def to_row(self) -> dict:
+        return {col: getattr(self, col) for col in STATE_COLUMNS}
+
+
+def advance_states(states, prices, dates):
+    """
+    `IndicatorState.update` for many states at once, in place. Row i of the
+    `prices` matrix holds the new prices for states[i] in date order, NaN
+    padded, and `dates` holds the matching bar dates. Gives the same results
+    as calling `update` price by price.
+    """
+    prices = np.asarray(prices, dtype=float)
+    n = len(states)
+    if n == 0 or prices.shape[1] == 0:
+        return states
+    rows = np.arange(n)
+    windows = np.array([state.ma_window for state in states])
+    buffer = np.zeros((n, windows.max()))
+    for i, state in enumerate(states):
+        buffer[i, :state.ma_window] = state.buffer
+    buffer_sum = np.array([state.buffer_sum for state in states], dtype=float)
+    head = np.array([state.buffer_head for state in states])
+    count = np.array([state.buffer_count for state in states])
+    ema = np.array([np.nan if state.ema is None else state.ema for state in states])
+    alpha = np.array([state.alpha for state in states])
+    old_wt = 1. - alpha
+    is_exp = np.array([state.strategy == EXP_MA for state in states])
+    # -1 for no position yet, 0 for sell, 1 for buy
+    position = np.array([{None: -1, 'sell': 0, 'buy': 1}[state.position] for state in states])
+    changed = np.array([bool(state.changed_from_yesterday) for state in states])
+    at_price = np.array([np.nan if state.at_price is None else state.at_price for state in states])
+    last_step = np.full(n, -1)
+
+    with np.errstate(invalid='ignore'):
+        for step in range(prices.shape[1]):
+            price = prices[:, step]
+            live = ~np.isnan(price)
+            # EMA, the same recurrence as IndicatorState._update_ema
+            mixed = (old_wt * ema + alpha * price) / (old_wt + alpha)
+            stepped = np.where(np.isnan(ema), price, np.where(ema != price, mixed, ema))
+            ema = np.where(live, stepped, ema)
+            # SMA ring buffers
+            full = count == windows
+            buffer_sum = np.where(live & full, buffer_sum - buffer[rows, head], buffer_sum)
+            count = np.where(live & ~full, count + 1, count)
+            buffer[rows[live], head[live]] = price[live]
+            buffer_sum = np.where(live, buffer_sum + price, buffer_sum)
+            head = np.where(live, (head + 1) % windows, head)
+            for i in np.flatnonzero(live & (head == 0)):
+                buffer_sum[i] = math.fsum(buffer[i, :count[i]])
+
+            ma = np.where(is_exp, ema, np.where(count == windows, buffer_sum / windows, np.nan))
+            new_position = (price > ma).astype(int)
+            changed = np.where(live, (position >= 0) & (new_position != position), changed)
+            position = np.where(live, new_position, position)
+            at_price = np.where(live, price, at_price)
+            last_step = np.where(live, step, last_step)
+
+    for i, state in enumerate(states):
+        if last_step[i] < 0:
+            continue
+        state.ema = float(ema[i])
+        state.buffer = buffer[i, :state.ma_window].tolist()
+        state.buffer_sum = float(buffer_sum[i])
+        state.buffer_head = int(head[i])
+        state.buffer_count = int(count[i])
+        state.position = 'buy' if position[i] == 1 else 'sell'
+        state.changed_from_yesterday = bool(changed[i])
+        state.at_price = float(at_price[i])
+        state.last_date = dates[i][last_step[i]]
+    return states
+
+
+def read_states(symbols=None) -> dict:
+    """Stored states keyed by symbol, for every symbol or just `symbols`."""
+    query = f'SELECT {", ".join(STATE_COLUMNS)} FROM indicator_state'
+    params = None
+    if symbols is not None:
+        query += ' WHERE symbol = ANY(%s)'
+        params = (list(symbols),)
+    with database.get_pool().cursor() as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    return {row[0]: IndicatorState(*row) for row in rows}
+
+
+def write_states(states, cur=None):
+    """
+    Inserts or replaces many states in one statement, on `cur` when given so
+    it can share a transaction with other writes.
+    """
+    from psycopg2.extras import execute_values
+    values = [tuple(v.item() if isinstance(v, np.generic) else v
+                    for v in (row[col] for col in STATE_COLUMNS))
+              for row in (state.to_row() for state in states)]
+    if not values:
+        return 0
+    updates = ', '.join(f'{col} = EXCLUDED.{col}' for col in STATE_COLUMNS[1:])
+    query = f'''
+    INSERT INTO indicator_state ({', '.join(STATE_COLUMNS)})
+    VALUES %s
+    ON CONFLICT (symbol) DO UPDATE SET {updates};'''
+    if cur is not None:
+        execute_values(cur, query, values, page_size=len(values))
+    else:
+        with database.get_pool().cursor(commit=True) as cur:
+            execute_values(cur, query, values, page_size=len(values))
+    return len(values)
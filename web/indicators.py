@@ -0,0 +1,115 @@
+"""
+Vectorized indicators for stacked multi-symbol price frames.
+
+The frames built by `StockData` hold every symbol's history in one table with
+a Symbol column. These helpers compute rolling statistics for all symbols in
+one pass over the columns instead of masking the frame once per symbol.
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def group_layout(symbols):
+    """
+    Returns (order, position) for a Symbol column: `order` sorts the rows so
+    each symbol's rows are contiguous (stable, so dates stay in order), and
+    `position` is each sorted row's offset from the start of its symbol.
+    """
+    codes, _ = pd.factorize(np.asarray(symbols))
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_lengths = np.diff(np.r_[starts, len(sorted_codes)])
+    position = np.arange(len(sorted_codes)) - np.repeat(starts, group_lengths)
+    return order, position
+
+
+def rolling_stat(values, symbols, window, stat, layout=None) -> np.ndarray:
+    """
+    Per-symbol rolling `stat` ('mean' or 'std') of `values`, aligned with the
+    input rows. Like pandas `rolling(window)`, a window is NaN until it holds
+    `window` rows of its own symbol and whenever it contains a NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    order, position = layout if layout is not None else group_layout(symbols)
+    result = np.full(len(values), np.nan)
+    if len(values) < window:
+        return result
+    # every window of `window` consecutive rows, without copying the data
+    windows = sliding_window_view(values[order], window)
+    if stat == 'mean':
+        computed = windows.mean(axis=1)
+    elif stat == 'std':
+        computed = windows.std(axis=1, ddof=1)
+    else:
+        raise ValueError(f"Expected 'mean' or 'std'; got {stat}")
+    sorted_result = np.full(len(values), np.nan)
+    sorted_result[window - 1:] = computed
+    # windows that reach back into the previous symbol's rows
+    sorted_result[position < window - 1] = np.nan
+    result[order] = sorted_result
+    return result
+
+
+def add_moving_average(df, rolling_window=20, price_col='Close',
+                       ma_col='optimum_day_moving_average', layout=None):
+    """Adds the per-symbol moving average of `price_col` to `df` in place."""
+    df[ma_col] = rolling_stat(df[price_col], df['Symbol'], rolling_window, 'mean', layout)
+    return df
+
+
+def add_bollinger_bands(df, rolling_avg_col='optimum_day_moving_average', rolling_window=20,
+                        n_std=2, layout=None):
+    """
+    Adds `bolinger_upper_band` and `bolinger_lower_band` to `df` in place: the
+    moving average plus and minus `n_std` rolling standard deviations of it.
+    """
+    layout = layout if layout is not None else group_layout(df['Symbol'])
+    ma = df[rolling_avg_col].to_numpy(dtype=float)
+    standard_dev = rolling_stat(ma, None, rolling_window, 'std', layout)
+    df['bolinger_upper_band'] = ma + standard_dev*n_std
+    df['bolinger_lower_band'] = ma - standard_dev*n_std
+    return df
+
+
+def trend_fit(values, symbols, layout=None) -> pd.DataFrame:
+    """
+    Least-squares line through each symbol's values against their position
+    in the symbol's history (0, 1, 2, ...), the same fit as `np.polyfit(x, y, 1)`
+    per symbol. Missing values are left out of the fit.
+
+    Returns one row per symbol with trend_slope, trend_intercept, trend_r2 and
+    trend_slope_pct (the slope as a fraction of the symbol's mean value).
+    """
+    values = np.asarray(values, dtype=float)
+    codes, uniques = pd.factorize(np.asarray(symbols))
+    order, position = layout if layout is not None else group_layout(codes)
+    codes = codes[order]
+    y = values[order]
+    x = position.astype(float)
+    valid = ~np.isnan(y)
+    codes, x, y = codes[valid], x[valid], y[valid]
+    n_groups = len(uniques)
+
+    # centre each group before summing so long, high priced histories don't lose precision
+    n = np.bincount(codes, minlength=n_groups).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.bincount(codes, x, n_groups) / n
+        mean_y = np.bincount(codes, y, n_groups) / n
+        dx = x - mean_x[codes]
+        dy = y - mean_y[codes]
+        sxx = np.bincount(codes, dx*dx, n_groups)
+        sxy = np.bincount(codes, dx*dy, n_groups)
+        syy = np.bincount(codes, dy*dy, n_groups)
+
+        slope = np.where(n > 1, sxy / sxx, np.nan)
+        intercept = mean_y - slope*mean_x
+        r2 = np.where(syy > 0, sxy*sxy / (sxx*syy), np.nan)
+        slope_pct = slope / mean_y
+
+    return pd.DataFrame({'trend_slope': slope,
+                         'trend_intercept': intercept,
+                         'trend_r2': r2,
+                         'trend_slope_pct': slope_pct},
+                        index=pd.Index(uniques, name='Symbol'))
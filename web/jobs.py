@@ -0,0 +1,268 @@
+"""
+Background job queue.
+
+Long running work (optimizer refreshes, the gainers rebuild) is handed to a
+small pool of worker threads so the request that started it can return at
+once with a job id. Submitting work under a key that already has a queued or
+running job returns that job instead of starting another.
+
+With a `JobStore` the job records live in sqlite instead of in the process,
+so under several server workers any of them can report a job's status, and
+a job already running on one worker isn't started again on another.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_DB = os.environ.get('JOB_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'jobs.db'))
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class Job:
+    def __init__(self, key, description):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.state = QUEUED
+        self.progress = 0.0
+        self.message = ''
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # the process running the job, and a callback that saves each change
+        self.pid = os.getpid()
+        self.on_change = None
+
+    def report(self, progress, message=''):
+        """Called by the job function to publish how far along it is (0 to 1)."""
+        self.progress = min(max(float(progress), 0.0), 1.0)
+        self.message = message
+        if self.on_change is not None:
+            self.on_change(self)
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    def to_dict(self) -> dict:
+        return dict(id=self.id, description=self.description, state=self.state,
+                    progress=self.progress, message=self.message, error=self.error,
+                    submitted_at=self.submitted_at, started_at=self.started_at,
+                    finished_at=self.finished_at)
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """
+    Job records in an sqlite table shared by every process on the host. A
+    queued or running job whose process has exited (a recycled or killed
+    worker) is reported as failed.
+    """
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        key TEXT NOT NULL,
+        description TEXT,
+        state TEXT NOT NULL,
+        progress REAL,
+        message TEXT,
+        error TEXT,
+        submitted_at REAL,
+        started_at REAL,
+        finished_at REAL,
+        pid INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS ix_jobs_key_state ON jobs (key, state);
+    '''
+    COLUMNS = ('id', 'key', 'description', 'state', 'progress', 'message', 'error',
+               'submitted_at', 'started_at', 'finished_at', 'pid')
+
+    def __init__(self, path=None, keep=1000):
+        self.path = path or JOB_DB
+        self.keep = keep
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        # autocommit, so claim() can take the write lock with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _row(self, job):
+        values = dict(job.to_dict(), key=json.dumps(list(job.key)), pid=job.pid)
+        return tuple(values[col] for col in self.COLUMNS)
+
+    def _job(self, row) -> Job:
+        job = Job(tuple(json.loads(row['key'])), row['description'])
+        for col in self.COLUMNS:
+            if col not in ('key', 'description'):
+                setattr(job, col, row[col])
+        if job.active and not _pid_alive(job.pid):
+            job.state = FAILED
+            job.error = 'The server worker running this job exited before it finished'
+            job.finished_at = job.finished_at or time.time()
+        return job
+
+    def claim(self, job):
+        """
+        Saves `job` unless a live job with the same key is queued or running,
+        and returns that job instead. Returns None when `job` was saved.
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute("SELECT * FROM jobs WHERE key = ? AND state IN (?, ?)",
+                                (json.dumps(list(job.key)), QUEUED, RUNNING)).fetchall()
+            for row in rows:
+                existing = self._job(row)
+                if existing.active:
+                    conn.execute('COMMIT')
+                    return existing
+                self._save(conn, existing)
+            self._save(conn, job)
+            conn.execute("""DELETE FROM jobs WHERE state IN (?, ?) AND id NOT IN
+                (SELECT id FROM jobs ORDER BY submitted_at DESC LIMIT ?)""", (DONE, FAILED, self.keep))
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return None
+
+    def _save(self, conn, job):
+        conn.execute(f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * len(self.COLUMNS))})", self._row(job))
+
+    def save(self, job):
+        conn = self._connect()
+        try:
+            self._save(conn, job)
+        finally:
+            conn.close()
+
+    def abandon_active(self):
+        """
+        Marks every queued or running job failed. For server startup, when no
+        job from an earlier run can still be going (and its pid may have been
+        reused since).
+        """
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE jobs SET state = ?, error = ?, finished_at = ? WHERE state IN (?, ?)',
+                         (FAILED, 'The server restarted before this job finished', time.time(),
+                          QUEUED, RUNNING))
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return None if row is None else self._job(row)
+
+    def active_jobs(self) -> list:
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT * FROM jobs WHERE state IN (?, ?) ORDER BY submitted_at',
+                                (QUEUED, RUNNING)).fetchall()
+        finally:
+            conn.close()
+        return [job for job in map(self._job, rows) if job.active]
+
+
+class JobQueue:
+    """
+    Runs submitted functions on `workers` threads and keeps the last
+    `keep` jobs around for status lookups, in `store` when one is given.
+    """
+    def __init__(self, workers=2, keep=1000, store=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.keep = keep
+        self.store = store
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, description, fn, *args) -> Job:
+        """
+        Queues `fn(*args, report=job.report)` unless a job with the same key is
+        already queued or running, in which case that job is returned.
+        """
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None and job.active:
+                return job
+            job = Job(key, description)
+            if self.store is not None:
+                existing = self.store.claim(job)
+                if existing is not None:
+                    return existing
+                job.on_change = self.store.save
+            self._active[key] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                old_id, old = next(iter(self._jobs.items()))
+                if old.active:
+                    break
+                del self._jobs[old_id]
+        self.executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        job.state = RUNNING
+        job.started_at = time.time()
+        self._changed(job)
+        try:
+            fn(*args, report=job.report)
+            job.report(1.0, 'Finished')
+            job.state = DONE
+        except Exception as e:
+            job.error = f'{type(e).__name__}: {e}'
+            job.message = traceback.format_exc(limit=3)
+            job.state = FAILED
+        finally:
+            job.finished_at = time.time()
+            self._changed(job)
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+    def _changed(self, job):
+        if self.store is not None:
+            self.store.save(job)
+
+    def get(self, job_id):
+        if self.store is not None:
+            return self.store.get(job_id)
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_jobs(self) -> list:
+        if self.store is not None:
+            return self.store.active_jobs()
+        with self._lock:
+            return [job for job in self._jobs.values() if job.active]
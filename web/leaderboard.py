@@ -0,0 +1,152 @@
+"""
+Ranked, paginated views of `optimum_symbol_parameters`.
+
+Each sort key reads from its own partial index (db/migrations/003), and pages
+are kept in memory until optimizer results change. Every cache key includes
+`data_version()`, so writes made by other processes (another server worker,
+the nightly sweep) show up within `VERSION_TTL` seconds.
+"""
+import logging
+import math
+import os
+import threading
+import time
+
+import pandas as pd
+
+import database
+from cache import TTLCache
+
+COMMON_COLUMNS = ['symbol_id', 'symbol', 'last_updated', 'calc_period']
+
+SORT_KEYS = {
+    'single': dict(multiple='single_param_optimum_multiple',
+                   columns=['single_param_optimum_window', 'single_param_optimum_multiple']),
+    'multi': dict(multiple='multi_param_optimum_multiple',
+                  columns=['multi_param_optimum_window_1', 'multi_param_optimum_window_2',
+                           'multi_param_optimum_multiple']),
+    'exp_ma': dict(multiple='exp_ma_optimum_multiple',
+                   columns=['exp_ma_optimum_window', 'exp_ma_optimum_multiple']),
+}
+
+PER_PAGE = 100
+MAX_PER_PAGE = 500
+CACHE_TTL = int(os.environ.get('LEADERBOARD_CACHE_TTL', 300))
+# seconds between checks of the table for writes by other processes
+VERSION_TTL = float(os.environ.get('LEADERBOARD_VERSION_TTL', 2))
+
+cache = TTLCache(ttl=CACHE_TTL, max_bytes=int(os.environ.get('LEADERBOARD_CACHE_MB', 16)) * 2**20)
+# bumped by every invalidation, so a page read before a write isn't cached after it
+_generation = 0
+# the last data_version() read and when it was read
+_version = None
+_version_checked = 0.0
+_version_lock = threading.Lock()
+
+
+def invalidate():
+    """Drops every cached page; called after optimizer results are written."""
+    global _generation, _version_checked
+    _generation += 1
+    _version_checked = 0.0
+    cache.clear()
+
+
+def data_version():
+    """
+    (newest last_updated, row count) of optimum_symbol_parameters. Every
+    optimizer write changes it, whichever process made it, so it is part of
+    every cache key and the pages' HTTP validator. Read from the database at
+    most once every VERSION_TTL seconds.
+    """
+    global _version, _version_checked
+    with _version_lock:
+        if time.monotonic() - _version_checked <= VERSION_TTL and _version is not None:
+            return _version
+        try:
+            with database.get_pool().cursor() as cur:
+                cur.execute('SELECT max(last_updated), count(*) FROM optimum_symbol_parameters;')
+                last_updated, rows = cur.fetchone()
+        except Exception as e:
+            if _version is None:
+                raise
+            # keep serving what is cached until the database is back
+            logging.warning(f'Failed to read the leaderboard version: {e}')
+            return _version
+        version = (None if last_updated is None else str(last_updated), rows)
+        if _version is not None and version != _version:
+            # pages of the old version can't be asked for again
+            cache.clear()
+        _version, _version_checked = version, time.monotonic()
+        return _version
+
+
+def _cached(key, build):
+    generation = _generation
+    key = (data_version(),) + tuple(key)
+
+    def build_current():
+        value = build()
+        return value, generation == _generation
+    return cache.get_or_set(key, build_current)
+
+
+def columns(sort_by) -> list:
+    return COMMON_COLUMNS + SORT_KEYS[sort_by]['columns'] + ['organic_growth']
+
+
+def check_sort_by(sort_by):
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"Expected one of {', '.join(SORT_KEYS)}; got {sort_by}")
+
+
+def count(sort_by) -> int:
+    """How many symbols have a result for `sort_by`."""
+    check_sort_by(sort_by)
+
+    def build():
+        with database.get_pool().cursor() as cur:
+            cur.execute(f"""SELECT count(*) FROM optimum_symbol_parameters
+            WHERE {SORT_KEYS[sort_by]['multiple']} IS NOT NULL;""")
+            return cur.fetchone()[0]
+    return _cached(('count', sort_by), build)
+
+
+def read_page(sort_by='single', page=1, per_page=PER_PAGE) -> pd.DataFrame:
+    """
+    One page of symbols ranked by their `sort_by` multiple, best first. Ties
+    are broken by symbol_id so pages never overlap.
+    """
+    check_sort_by(sort_by)
+    per_page = min(max(int(per_page), 1), MAX_PER_PAGE)
+    page = max(int(page), 1)
+
+    def build():
+        multiple = SORT_KEYS[sort_by]['multiple']
+        cols = columns(sort_by)
+        with database.get_pool().cursor() as cur:
+            cur.execute(f"""SELECT {', '.join(cols)}
+            FROM optimum_symbol_parameters
+            WHERE {multiple} IS NOT NULL
+            ORDER BY {multiple} DESC, symbol_id
+            LIMIT %s OFFSET %s;""", (per_page, (page - 1) * per_page))
+            return pd.DataFrame(data=cur.fetchall(), columns=cols)
+    return _cached(('page', sort_by, page, per_page), build)
+
+
+def page_info(sort_by='single', page=1, per_page=PER_PAGE) -> dict:
+    """Page numbers for the pagination links."""
+    per_page = min(max(int(per_page), 1), MAX_PER_PAGE)
+    pages = max(math.ceil(count(sort_by) / per_page), 1)
+    page = min(max(int(page), 1), pages)
+    return dict(sort_by=sort_by, page=page, per_page=per_page, pages=pages,
+                prev_page=page - 1 if page > 1 else None,
+                next_page=page + 1 if page < pages else None)
+
+
+def cached_render(key, render):
+    """
+    Caches anything rendered from the leaderboard (like a page's HTML table)
+    alongside the pages, so it is dropped by the same invalidation.
+    """
+    return _cached(('rendered',) + tuple(key), render)
@@ -0,0 +1,328 @@
+"""
+Latency histograms and counters, served on /metrics in the Prometheus text
+format.
+
+`init_app` times every Flask route, and `timed(stage)` times a piece of work
+inside one (a Yahoo download, a database query, a chart serialization).
+Recording an observation is a dict lookup and a bisect under a lock, cheap
+enough to leave on under load.
+
+Under gunicorn every worker keeps its own numbers. With METRICS_DIR set, a
+background thread in each process writes a snapshot there every
+FLUSH_INTERVAL seconds while there is something new, and /metrics adds up
+the snapshots of all workers, including ones that exited.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+PREFIX = 'stock_app_'
+
+# seconds; from a cache hit up to a cold stock page or an optimizer sweep
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1.0):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.values)
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: [list(counts), total] for key, (counts, total) in self.values.items()}
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+
+
+REQUESTS = Counter(PREFIX + 'http_requests_total', 'HTTP requests by route, method and status.',
+                   ('route', 'method', 'status'))
+REQUEST_SECONDS = Histogram(PREFIX + 'http_request_duration_seconds',
+                            'Time from the start of a request until its response was fully sent.',
+                            ('route', 'method'))
+STAGE_SECONDS = Histogram(PREFIX + 'stage_duration_seconds',
+                          'Time spent in each internal stage (downloads, queries, scoring, serialization).',
+                          ('stage',))
+STAGE_ERRORS = Counter(PREFIX + 'stage_errors_total', 'Stages that raised an exception.', ('stage',))
+
+REGISTRY = {metric.name: metric for metric in (REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, STAGE_ERRORS)}
+
+_dirty = False
+_flusher_pid = None
+_flush_lock = threading.Lock()
+
+
+def _after_fork():
+    # a forked worker starts from zero and never writes the parent's numbers;
+    # its flusher thread didn't survive the fork either
+    global _dirty, _flush_lock
+    for metric in REGISTRY.values():
+        metric.values = {}
+        metric._lock = threading.Lock()
+    _dirty = False
+    _flush_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def observe_stage(stage, seconds, failed=False):
+    STAGE_SECONDS.observe(seconds, stage)
+    if failed:
+        STAGE_ERRORS.inc(stage)
+    _changed()
+
+
+@contextmanager
+def timed(stage):
+    """Records how long the block takes under `stage`, and whether it raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        observe_stage(stage, time.perf_counter() - started, failed=True)
+        raise
+    observe_stage(stage, time.perf_counter() - started)
+
+
+def timed_function(stage):
+    """Decorator version of `timed`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+########################################################################
+# Snapshots shared between worker processes
+
+def _path(name):
+    return os.path.join(METRICS_DIR, f'{name}.json')
+
+
+def snapshot() -> dict:
+    """This process's metrics as {name: [[label values, value], ...]}, ready for JSON."""
+    return {name: [[list(key), value] for key, value in metric.snapshot().items()]
+            for name, metric in REGISTRY.items()}
+
+
+def _write(path, data):
+    with open(f'{path}.{os.getpid()}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+
+def _read(path) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def flush():
+    """Writes this process's snapshot to METRICS_DIR, if it is set."""
+    global _dirty
+    if not METRICS_DIR:
+        return
+    with _flush_lock:
+        _dirty = False
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write(_path(os.getpid()), snapshot())
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if _dirty:
+            try:
+                flush()
+            except OSError as e:
+                print(f'Failed to write metrics snapshot: {e}')
+
+
+def _changed():
+    global _dirty, _flusher_pid
+    _dirty = True
+    if METRICS_DIR and _flusher_pid != os.getpid():
+        with _flush_lock:
+            if _flusher_pid != os.getpid():
+                _flusher_pid = os.getpid()
+                threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def _merge(total, data):
+    for name, series in data.items():
+        metric = REGISTRY.get(name)
+        if metric is None:
+            continue
+        values = total.setdefault(name, {})
+        for key, value in series:
+            key = tuple(key)
+            values[key] = metric.merge(values[key], value) if key in values else value
+    return total
+
+
+def archive(pid):
+    """
+    Folds an exited worker's snapshot into the archive so its counts are
+    kept. Called by the gunicorn master when a worker exits.
+    """
+    if not METRICS_DIR:
+        return
+    data = _read(_path(pid))
+    if data:
+        archived = _merge({}, _read(_path('archive')))
+        _merge(archived, data)
+        _write(_path('archive'), {name: [[list(key), value] for key, value in values.items()]
+                                  for name, values in archived.items()})
+    try:
+        os.remove(_path(pid))
+    except OSError:
+        pass
+
+
+def clear():
+    """Drops the snapshots of a previous server run."""
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            os.remove(os.path.join(METRICS_DIR, name))
+
+
+def collect() -> dict:
+    """Every process's metrics added up, as {name: {label values: value}}."""
+    total = {}
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        mine = f'{os.getpid()}.json'
+        for name in os.listdir(METRICS_DIR):
+            if name.endswith('.json') and name != mine:
+                _merge(total, _read(os.path.join(METRICS_DIR, name)))
+    # this process's own numbers are read live rather than from its last flush
+    return _merge(total, snapshot())
+
+
+########################################################################
+# Prometheus text format
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(values=None) -> str:
+    values = collect() if values is None else values
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(values.get(name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_labels(metric.labels, key)} {_number(value)}')
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{name}_bucket{_labels(metric.labels, key, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labels, key)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(metric.labels, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+########################################################################
+# Flask
+
+# flask is imported where it's used, so the batch jobs that record stages
+# don't pay for importing it
+
+def _start_timer():
+    from flask import g
+    g.metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    from flask import g, request
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    # the rule rather than the path, so /showLineChart/<symbol> is one series
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    method = request.method
+    status = str(response.status_code)
+
+    def record():
+        REQUESTS.inc(route, method, status)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route, method)
+        _changed()
+    # streamed responses are still sending here, so record once they are closed
+    response.call_on_close(record)
+    return response
+
+
+def metrics_view():
+    from flask import Response
+    return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
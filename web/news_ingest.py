@@ -0,0 +1,130 @@
+"""
+Background news ingestion.
+
+Pulls the Yahoo Finance news list for the tracked symbols, scrapes and scores
+only the article URLs that aren't in the article store yet, and saves them so
+the stock page can read precomputed sentiment.
+
+Usage: python news_ingest.py [SYMBOL ...] [--interval SECONDS]
+"""
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import article_store
+import database
+import metrics
+import nlp
+
+SQLITE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'database.db')
+
+
+@metrics.timed_function('yfinance_news')
+def news_items(symbol) -> list:
+    """The current Yahoo Finance news list for a symbol."""
+    import yfinance as yf
+    return yf.Ticker(symbol).news or []
+
+
+def fetch_article(item):
+    """
+    Downloads one news item's article text. Returns None if it couldn't be
+    fetched, so it is tried again on the next run.
+    """
+    from analysis import Article
+    try:
+        contents = Article(item['link']).contents
+    except Exception as e:
+        print(f"Failed to fetch {item['link']}: {e}")
+        return None
+    return dict(url=item['link'], title=item.get('title'), publisher=item.get('publisher'),
+                publish_time=item.get('providerPublishTime'), contents=contents)
+
+
+def process_items(items, workers=8, processes=None) -> list:
+    """
+    Fetches the articles for `items` concurrently and scores them in one batch.
+    Returns the article dicts ready for `article_store.save_articles`.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        articles = [a for a in pool.map(fetch_article, items) if a is not None]
+    scores = nlp.analyze_batch([a['contents'] for a in articles], processes=processes)
+    for article, (summary, polarity) in zip(articles, scores):
+        article['summary'] = summary
+        article['polarity'] = polarity
+    return articles
+
+
+def ingest_symbol(conn, symbol, items=None, workers=8, processes=None) -> int:
+    """
+    Stores the articles for a symbol's news that haven't been seen before and
+    returns how many were added.
+    """
+    items = news_items(symbol) if items is None else items
+    items = [item for item in items if item.get('link')]
+    seen = article_store.known_urls(conn, (item['link'] for item in items))
+    new_items = list({item['link']: item for item in items if item['link'] not in seen}.values())
+    articles = process_items(new_items, workers, processes) if new_items else []
+    if articles:
+        article_store.save_articles(conn, articles)
+    stored = seen | {a['url'] for a in articles}
+    article_store.link_symbol(conn, symbol, [item['link'] for item in items if item['link'] in stored])
+    return len(articles)
+
+
+def tracked_symbols(top=100) -> list:
+    """
+    Today's gainers plus the best performing symbols from the optimizer
+    leaderboards.
+    """
+    symbols = []
+    try:
+        conn = sqlite3.connect(SQLITE_DB)
+        symbols += pd.read_sql('SELECT Symbol FROM today_results', con=conn)['Symbol'].to_list()
+        conn.close()
+    except Exception as e:
+        print(f'Could not read today_results: {e}')
+    try:
+        with database.get_pool().cursor() as cur:
+            cur.execute('''
+            SELECT symbol FROM optimum_symbol_parameters
+            ORDER BY GREATEST(COALESCE(single_param_optimum_multiple, 0),
+                              COALESCE(exp_ma_optimum_multiple, 0)) DESC
+            LIMIT %s;''', (top,))
+            symbols += [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        print(f'Could not read the leaderboard: {e}')
+    return list(dict.fromkeys(s.upper() for s in symbols))
+
+
+def run(symbols, workers=8, processes=None):
+    conn = article_store.get_connection()
+    added = 0
+    for symbol in symbols:
+        try:
+            added += ingest_symbol(conn, symbol, workers=workers, processes=processes)
+        except Exception as e:
+            print(f'Failed to ingest news for {symbol}: {e}')
+    conn.close()
+    print(f'Ingested {added} new articles for {len(symbols)} symbols')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape and score new news articles for tracked symbols')
+    parser.add_argument('symbols', nargs='*', help='symbols to ingest (default: tracked symbols)')
+    parser.add_argument('--interval', type=int, default=0,
+                        help='keep running, ingesting every INTERVAL seconds')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent article downloads')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='processes for scoring large batches of articles')
+    args = parser.parse_args()
+
+    while True:
+        run(args.symbols or tracked_symbols(), args.workers, args.processes)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
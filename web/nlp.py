@@ -0,0 +1,102 @@
+"""
+Article summarization and sentiment scoring.
+
+The stopword list, tokenizer pattern and VADER lexicon are loaded once per
+process by `get_engine()` and reused for every article.
+"""
+import re
+import threading
+from collections import Counter
+from multiprocessing import Pool
+
+import metrics
+
+# text Yahoo serves instead of an article when the page fails to load
+FAIL_SENTENCE = 'Our engineers are working quickly to resolve the issue.'
+FAIL_TEXT = 'Thank you for your patience. ' + FAIL_SENTENCE
+NO_CONTENTS = 'No article contents found.'
+
+# batches smaller than this are never worth starting processes for
+MIN_POOL_BATCH = 50
+
+
+class NLPEngine:
+    def __init__(self):
+        from nltk.corpus import stopwords
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        from nltk.tokenize import sent_tokenize, word_tokenize
+        self.stop = frozenset(stopwords.words('english'))
+        self.word = re.compile('^[a-z]+$')
+        self.analyzer = SentimentIntensityAnalyzer()
+        self.sent_tokenize = sent_tokenize
+        self.word_tokenize = word_tokenize
+
+    def is_ok(self, token):
+        return self.word.match(token) and token not in self.stop
+
+    def tokenize(self, sent):
+        return [word for word in self.word_tokenize(sent) if self.is_ok(word)]
+
+    @metrics.timed_function('summarize')
+    def summarize(self, text, n=5):
+        """
+        The `n` sentences whose words are most frequent across the text, or
+        None when the text is Yahoo's error page.
+        """
+        sents = self.sent_tokenize(text)
+        # a "bag of words" per sentence, only the words that are is_ok()
+        bow = [self.tokenize(sent) for sent in sents]
+        tf = Counter()
+        for sent in bow:
+            tf.update(sent)
+
+        def score(i):
+            return sum(tf[word] for word in bow[i])
+
+        idx = sorted(range(len(bow)), key=score, reverse=True)[:n]
+        summary_text = ' '.join(sents[i] for i in idx)
+        if summary_text != FAIL_SENTENCE:
+            return summary_text
+
+    def polarity_scores(self, text):
+        if text != FAIL_TEXT:
+            with metrics.timed('sentiment'):
+                return self.analyzer.polarity_scores(text)
+        return NO_CONTENTS
+
+    def analyze(self, text, n=5):
+        """(summary, polarity scores) for one article text."""
+        return self.summarize(text, n), self.polarity_scores(text)
+
+
+_engine = None
+_lock = threading.Lock()
+
+
+def get_engine() -> NLPEngine:
+    """The process wide engine, loaded on first use."""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = NLPEngine()
+    return _engine
+
+
+def _analyze(text_n):
+    return get_engine().analyze(*text_n)
+
+
+def analyze_batch(texts, n=5, processes=None):
+    """
+    Summaries and polarity scores for many article texts, in order, as a list of
+    (summary, polarity scores). With `processes`, large batches are spread over
+    a process pool whose workers each load the engine once.
+    """
+    texts = list(texts)
+    if processes and processes > 1 and len(texts) >= MIN_POOL_BATCH:
+        with Pool(processes, initializer=get_engine) as pool:
+            chunksize = max(1, len(texts) // (processes * 4))
+            return pool.map(_analyze, [(text, n) for text in texts], chunksize=chunksize)
+    engine = get_engine()
+    return [engine.analyze(text, n) for text in texts]
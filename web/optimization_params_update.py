@@ -1,30 +1,145 @@
-from mv_avg_window_optimizer import Optimized_Symbol, add_lag_price
+from mv_avg_window_optimizer import Optimized_Symbol, Optimum_Parameter_Writer
 import pandas as pd
 from tqdm import tqdm
-import sys
-
-stocks = pd.read_csv('/home/ksmith/flask_stock_visualizer/web/nasdaq_screener_1690226089920.csv')
-
-stock_list = stocks.Symbol.to_list()
-
-# for symbol in stock_list:
-#     Optimized_Symbol(symbol)
-
-try:
-    start_idx = int(sys.argv[1])
-except:
-    start_idx = None
-    
-# print(start_idx)
-
-if start_idx != None:
-    for symbol in tqdm(stock_list[start_idx:]):
-    # for symbol in stock_list[start_idx:]:
-        Optimized_Symbol(symbol)
-        # print(type(symbol))
-            
-else:
-    for symbol in tqdm(stock_list):
-    # for symbol in stock_list:
-        Optimized_Symbol(symbol)
-            
\ No newline at end of file
+import argparse
+import multiprocessing
+import os
+
+SYMBOLS_CSV = '/home/ksmith/flask_stock_visualizer/web/nasdaq_screener_1690226089920.csv'
+# one checkpoint per sweep: a rerun after a crash resumes it, even past
+# midnight, and a sweep that completes moves it aside so the next one starts over
+CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optimization_checkpoint.tsv')
+
+
+def optimize_symbol(symbol, refresh=False):
+    """
+    Runs the optimizers for one symbol. The database rows are handed back to the
+    main process, which writes them in batches.
+    Returns (symbol, rows, error message or None) so one bad symbol doesn't stop the sweep.
+    """
+    writer = Optimum_Parameter_Writer(flush_every=None)
+    try:
+        opt = Optimized_Symbol(symbol, writer=writer)
+        # new symbols were just calculated by the constructor
+        if refresh and not hasattr(opt, 'single_param_opt'):
+            opt.refresh()
+        return symbol, writer.take(), None
+    except Exception as e:
+        return symbol, [], f'{type(e).__name__}: {e}'.replace('\t', ' ').replace('\n', ' ')
+
+
+def optimize_symbol_refresh(symbol):
+    return optimize_symbol(symbol, refresh=True)
+
+
+def read_checkpoint(path):
+    """
+    Reads the symbols already handled by earlier runs as {symbol: status}.
+    Later lines win, so a symbol that failed and then succeeded counts as done.
+    """
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) >= 2:
+                    done[parts[0]] = parts[1]
+    return done
+
+
+def write_checkpoint(f, symbol, error):
+    # one line per symbol, flushed to disk so a killed run loses nothing
+    status = 'done' if error is None else 'failed'
+    f.write(f'{symbol}\t{status}\t{error or ""}\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def sweep(stock_list, workers, checkpoint, refresh=False, retry_failed=False, batch_size=500):
+    """
+    Optimizes every symbol in `stock_list` that `checkpoint` doesn't record as
+    handled yet. Once all of them are, the checkpoint is moved to
+    `<checkpoint>.last`, replacing the previous sweep's, so the next sweep
+    starts over and the failures of this one can still be looked up.
+    """
+    done = read_checkpoint(checkpoint)
+    skip = {s for s, status in done.items() if status == 'done' or not retry_failed}
+    todo = [s for s in stock_list if s not in skip]
+    print(f'{len(stock_list)} symbols, {len(stock_list) - len(todo)} already in checkpoint, '
+          f'{len(todo)} to go on {workers} worker(s)')
+
+    worker_fn = optimize_symbol_refresh if refresh else optimize_symbol
+    writer = Optimum_Parameter_Writer(flush_every=None)
+    # symbols whose rows are buffered; checkpointed only once the rows are written
+    pending = []
+    failed = 0
+
+    def flush():
+        writer.flush()
+        for symbol in pending:
+            write_checkpoint(f, symbol, None)
+        pending.clear()
+
+    with open(checkpoint, 'a') as f, tqdm(total=len(todo), unit='symbol', smoothing=0.05) as progress:
+        if workers > 1:
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap_unordered(worker_fn, todo)
+        else:
+            pool = None
+            results = map(worker_fn, todo)
+        try:
+            for symbol, rows, error in results:
+                if error is not None:
+                    write_checkpoint(f, symbol, error)
+                    failed += 1
+                    progress.set_postfix(failed=failed, refresh=False)
+                else:
+                    for row in rows:
+                        writer.add(row)
+                    pending.append(symbol)
+                    if len(pending) >= batch_size:
+                        flush()
+                progress.update()
+            flush()
+        except KeyboardInterrupt:
+            # keep what was already calculated
+            flush()
+            raise
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    finished = f'{checkpoint}.last'
+    os.replace(checkpoint, finished)
+    print(f'Finished: {len(todo) - failed} ok, {failed} failed (see {finished})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Optimize moving average parameters for every NASDAQ symbol')
+    parser.add_argument('start_idx', nargs='?', type=int, default=None,
+                        help='position in the symbol list to start from')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('--symbols', default=SYMBOLS_CSV, help='csv with a Symbol column')
+    parser.add_argument('--checkpoint', default=CHECKPOINT,
+                        help='file recording completed and failed symbols until the sweep completes')
+    parser.add_argument('--refresh', action='store_true',
+                        help='recalculate symbols that already exist in the database')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='symbols per bulk database write')
+    parser.add_argument('--offline', action='store_true',
+                        help='only use price history already in the local store')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='run symbols that failed in an earlier run again')
+    args = parser.parse_args()
+    if args.offline:
+        # inherited by the worker processes
+        os.environ['PRICE_STORE_OFFLINE'] = '1'
+
+    stocks = pd.read_csv(args.symbols)
+    stock_list = stocks.Symbol.dropna().astype(str).to_list()
+    if args.start_idx is not None:
+        stock_list = stock_list[args.start_idx:]
+
+    sweep(stock_list, max(1, args.workers), args.checkpoint,
+          refresh=args.refresh, retry_failed=args.retry_failed, batch_size=max(1, args.batch_size))
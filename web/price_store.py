@@ -0,0 +1,238 @@
+"""
+Local price history store.
+
+Keeps one Parquet file of daily bars per symbol and only downloads the bars
+newer than the last stored date, so repeat lookups read from disk instead of
+pulling a full year from Yahoo Finance every time.
+"""
+import json
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+HISTORY_DIR = os.environ.get('PRICE_HISTORY_DIR',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'history'))
+# how long a stored history counts as current before asking Yahoo for new bars
+MAX_AGE = timedelta(minutes=int(os.environ.get('PRICE_HISTORY_MAX_AGE_MINUTES', 60)))
+# relative difference between a stored and a re-downloaded close that means
+# Yahoo has adjusted the history since it was stored
+ADJUSTMENT_TOLERANCE = 1e-4
+ACTION_COLUMNS = ('Stock Splits', 'Dividends')
+
+
+def is_offline():
+    """Offline mode never touches the network and only serves stored bars."""
+    return os.environ.get('PRICE_STORE_OFFLINE', '') not in ('', '0')
+
+
+def period_start(period, end) -> pd.Timestamp:
+    """
+    Earliest date covered by a yfinance style period ('5d', '12mo', '1y', 'max')
+    ending at `end`. Returns None for 'max'.
+    """
+    if period == 'max':
+        return None
+    if period == 'ytd':
+        return end.normalize().replace(month=1, day=1)
+    for suffix, offset in [('mo', lambda n: pd.DateOffset(months=n)),
+                           ('y', lambda n: pd.DateOffset(years=n)),
+                           ('wk', lambda n: pd.DateOffset(weeks=n)),
+                           ('d', lambda n: pd.DateOffset(days=n))]:
+        if period.endswith(suffix):
+            return end.normalize() - offset(int(period[:-len(suffix)]))
+    raise ValueError(f'Unsupported period {period}')
+
+
+def _paths(symbol):
+    symbol = symbol.upper()
+    return (os.path.join(HISTORY_DIR, f'{symbol}.parquet'),
+            os.path.join(HISTORY_DIR, f'{symbol}.json'))
+
+
+def read_stored(symbol):
+    """
+    Returns the stored (history, meta) for a symbol, or (None, {}) if nothing
+    has been stored yet.
+    """
+    data_path, meta_path = _paths(symbol)
+    if not os.path.exists(data_path):
+        return None, {}
+    history = pd.read_parquet(data_path)
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    return history, meta
+
+
+def write_stored(symbol, history, meta):
+    """
+    Replaces the stored history for a symbol. Files are written next to the
+    target and renamed over it, so readers in other processes never see a
+    half written file.
+    """
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    data_path, meta_path = _paths(symbol)
+    _replace(data_path, 'wb', history.to_parquet)
+    _replace(meta_path, 'w', lambda f: json.dump(meta, f))
+
+
+def _replace(path, mode, write):
+    # a unique temp file per write, so threads storing the same symbol at
+    # once don't rename each other's files away
+    fd, tmp_path = tempfile.mkstemp(dir=HISTORY_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def download(symbol, period=None, start=None) -> pd.DataFrame:
+    import yfinance as yf
+    ticker = yf.Ticker(symbol)
+    with metrics.timed('yfinance_history'):
+        if start is not None:
+            return ticker.history(start=start)
+        return ticker.history(period=period)
+
+
+def covers(meta, period, now) -> bool:
+    """Whether the stored bars reach back far enough for `period`."""
+    if 'covered_start' not in meta:
+        return False
+    if meta['covered_start'] is None:
+        # everything Yahoo had was downloaded
+        return True
+    wanted_start = period_start(period, now)
+    return wanted_start is not None and wanted_start >= pd.Timestamp(meta['covered_start'])
+
+
+def readjusted(stored, new_bars, check_from) -> bool:
+    """
+    Whether Yahoo's split and dividend adjusted prices no longer line up with
+    the stored bars: the re-downloaded close of the stored bar at `check_from`
+    differs, or a bar after it has a split or dividend the store doesn't have.
+    """
+    if new_bars.empty:
+        return False
+    old, new = stored.loc[check_from:check_from], new_bars[new_bars.index.date == check_from.date()]
+    if old.empty or new.empty:
+        # nothing to compare against, so don't trust the stored prices
+        return True
+    if not np.isclose(new['Close'].iloc[0], old['Close'].iloc[0], rtol=ADJUSTMENT_TOLERANCE, atol=0):
+        return True
+    later = new_bars[new_bars.index.date > check_from.date()]
+    for column in ACTION_COLUMNS:
+        if column not in later:
+            continue
+        actions = later[column].fillna(0)
+        known = (stored[column].reindex(later.index).fillna(0) if column in stored
+                 else pd.Series(0.0, index=later.index))
+        if ((actions != 0) & (actions != known)).any():
+            return True
+    return False
+
+
+def update(symbol, period='12mo', stored=None, meta=None):
+    """
+    Brings the stored history for a symbol up to date and returns it with its
+    metadata. Only bars from the last stored date on are downloaded; the whole
+    period is downloaded when nothing is stored or the store doesn't reach back
+    far enough, and everything stored is downloaded again once a split or
+    dividend has changed Yahoo's adjusted prices.
+    """
+    if stored is None:
+        stored, meta = read_stored(symbol)
+    now = pd.Timestamp.now()
+
+    if stored is None or stored.empty or not covers(meta, period, now):
+        history = download(symbol, period=period)
+        wanted_start = period_start(period, now)
+        meta = {'covered_start': None if wanted_start is None else wanted_start.isoformat()}
+        if not history.empty and stored is not None and not stored.empty:
+            history = pd.concat([stored[stored.index < history.index[0]], history])
+    else:
+        # the last stored bar may have been a partial day, so fetch it again,
+        # along with the complete bar before it to check the adjustment against
+        check_from = stored.index[-2] if len(stored) > 1 else stored.index[-1]
+        new_bars = download(symbol, start=check_from.date())
+        if readjusted(stored, new_bars, check_from):
+            covered_start = meta.get('covered_start')
+            if covered_start is None:
+                history = download(symbol, period='max')
+            else:
+                history = download(symbol, start=pd.Timestamp(covered_start).date())
+            if history.empty:
+                # try again on the next update rather than lose the stored bars
+                history = stored
+        else:
+            history = pd.concat([stored, new_bars])
+            history = history[~history.index.duplicated(keep='last')]
+
+    meta['fetched_at'] = now.isoformat()
+    if not history.empty:
+        write_stored(symbol, history, meta)
+    return history, meta
+
+
+def get_history(symbol, period='12mo') -> pd.DataFrame:
+    """
+    Daily bars for `symbol` over `period`, served from the local store and
+    topped up with any newer bars. Drop-in for `yf.Ticker(symbol).history(period=period)`.
+    """
+    symbol = symbol.upper()
+    stored, meta = read_stored(symbol)
+    fetched_at = meta.get('fetched_at')
+    now = pd.Timestamp.now()
+    current = (stored is not None and fetched_at is not None
+               and now - pd.Timestamp(fetched_at) <= MAX_AGE
+               and covers(meta, period, now))
+    if not is_offline() and not current:
+        history, meta = update(symbol, period, stored, meta)
+    elif stored is None:
+        return pd.DataFrame()
+    else:
+        history = stored
+
+    if history.empty:
+        return history
+    start = period_start(period, history.index[-1])
+    if start is not None:
+        history = history[history.index >= start]
+    return history.copy()
+
+
+def load_histories(symbols, period='12mo', workers=8) -> pd.DataFrame:
+    """
+    Histories for many symbols, fetched concurrently on up to `workers`
+    threads and stacked in one concatenation with a (Symbol, Date) MultiIndex.
+    A symbol that fails or has no bars is left out instead of failing the batch.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    symbols = list(dict.fromkeys(symbols))
+
+    def fetch(symbol):
+        try:
+            return get_history(symbol, period)
+        except Exception as e:
+            logging.warning(f'Failed to load history for {symbol}: {e}')
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(symbols) or 1))) as pool:
+        histories = dict(zip(symbols, pool.map(fetch, symbols)))
+    histories = {s: h for s, h in histories.items() if h is not None and not h.empty}
+    if not histories:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=['Symbol', 'Date']))
+    return pd.concat(histories, names=['Symbol', 'Date'])
@@ -0,0 +1,38 @@
+"""
+Synthetic price histories shared by the tests and the bench_*.py scripts.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def random_walk(rng, shape, start=50.0, volatility=0.02):
+    """Closes of a geometric random walk along the last axis of `shape`."""
+    return start * np.exp(np.cumsum(rng.normal(0, volatility, shape), axis=-1))
+
+
+def make_history(n_bars, seed=0, start='2023-01-01', tz=None) -> pd.DataFrame:
+    """Random walk Open/Close history shaped like a yfinance download."""
+    rng = np.random.default_rng(seed)
+    close = random_walk(rng, n_bars)
+    open_ = close * (1 + rng.normal(0, 0.005, n_bars))
+    index = pd.date_range(start, periods=n_bars, freq='B', name='Date', tz=tz)
+    return pd.DataFrame({'Open': open_, 'Close': close}, index=index)
+
+
+def make_stocks_df(n_symbols, n_bars, seed=0) -> pd.DataFrame:
+    """Random walk closes for many symbols, stacked like StockData.build_stocks_df."""
+    close = random_walk(np.random.default_rng(seed), (n_symbols, n_bars))
+    index = pd.DatetimeIndex(np.tile(pd.date_range('2023-01-01', periods=n_bars, freq='B'), n_symbols),
+                             name='Date')
+    return pd.DataFrame({'Close': close.ravel(),
+                         'Symbol': np.repeat([f'SYM{i}' for i in range(n_symbols)], n_bars)},
+                        index=index)
+
+
+def timed(fn, *args):
+    """(fn(*args), seconds it took)."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
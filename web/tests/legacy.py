@@ -0,0 +1,60 @@
+"""
+The original iterrows backtests from mv_avg_window_optimizer, kept as the
+reference the vectorized engine in backtest.py is checked against.
+"""
+import pandas as pd
+
+
+def legacy_sma_backtest(df, n):
+    df['sma'] = df.Close.rolling(n).mean()
+    in_position = False
+    profits = []
+    for index, row in df.iterrows():
+        if not in_position:
+            if row.Close > row.sma:
+                buyprice = row.price
+                in_position = True
+        if in_position:
+            if row.Close < row.sma:
+                profits.append((row.price - buyprice)/buyprice)
+                in_position = False
+    return round((pd.Series(profits) + 1).prod(), 3)
+
+
+def legacy_exp_ma_backtest(df, n):
+    df['exp_ma'] = df['price'].ewm(span=n, adjust=False).mean()
+    in_position = False
+    profits = []
+    for index, row in df.iterrows():
+        if not in_position:
+            if row['exp_ma'] > row['price']:
+                buyprice = row.price
+                in_position = True
+        if in_position:
+            if row['exp_ma'] < row['price']:
+                profits.append((row.price - buyprice)/buyprice)
+                in_position = False
+    return round((pd.Series(profits) + 1).prod(), 3)
+
+
+def legacy_two_backtest(df, n, m):
+    df['sma_1'] = df.Close.rolling(n).mean()
+    df['sma_2'] = df.Close.rolling(m).mean()
+    in_position = False
+    profits = []
+    for index, row in df.iterrows():
+        if not in_position:
+            if row.sma_1 > row.sma_2:
+                buyprice = row.price
+                in_position = True
+        if in_position:
+            if row.sma_1 < row.sma_2:
+                profits.append((row.price - buyprice)/buyprice)
+                in_position = False
+    return round((pd.Series(profits) + 1).prod(), 3)
+
+
+def legacy_optimize(df, backtest_fn):
+    calcs = pd.Series({n: backtest_fn(df, n) for n in range(5, 366, 5)})
+    maxidx = calcs.idxmax()
+    return (maxidx, calcs.loc[maxidx])
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+from mv_avg_window_optimizer import Optimized_Symbol, add_lag_price
+from tests.fixtures import make_history
+from tests.legacy import legacy_exp_ma_backtest, legacy_optimize, legacy_sma_backtest, legacy_two_backtest
+
+SEEDS = (0, 1, 2)
+
+
+def pandas_ewm(values, spans):
+    return np.vstack([pd.Series(values).ewm(span=n, adjust=False).mean().to_numpy() for n in spans])
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_ema_matrix_matches_pandas_ewm(seed):
+    price = make_history(250, seed)['Close'].to_numpy()
+    assert np.array_equal(backtest.ema_matrix(price, backtest.WINDOWS), pandas_ewm(price, backtest.WINDOWS))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_ema_matrix_matches_pandas_ewm_with_missing_bars(seed):
+    price = make_history(250, seed)['Close'].to_numpy().copy()
+    price[np.random.default_rng(seed).choice(np.arange(1, 249), 5, replace=False)] = np.nan
+    price[0] = np.nan
+    price[-1] = np.nan
+    assert np.array_equal(backtest.ema_matrix(price, backtest.WINDOWS), pandas_ewm(price, backtest.WINDOWS),
+                          equal_nan=True)
+
+
+def test_ema_matrix_all_missing():
+    price = np.full(20, np.nan)
+    assert np.array_equal(backtest.ema_matrix(price, [5, 10]), pandas_ewm(price, [5, 10]), equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_single_sma_optimum_matches_legacy(seed):
+    history = make_history(250, seed)
+    opt = Optimized_Symbol.Single_Parameter_Optimizer(history)
+    assert (opt.optimum_window, opt.optimum_multiple) == legacy_optimize(add_lag_price(history), legacy_sma_backtest)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_exp_ma_optimum_matches_legacy(seed):
+    history = make_history(250, seed)
+    opt = Optimized_Symbol.Exponential_Moving_Average_Optimizer(history)
+    assert (opt.optimum_window, opt.optimum_multiple) == legacy_optimize(add_lag_price(history), legacy_exp_ma_backtest)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_pair_grid_optimum_matches_legacy(seed):
+    # the legacy grid over all PAIR_WINDOWS takes about a minute, so search a smaller one
+    windows = np.arange(10, 130, 20)
+    df = add_lag_price(make_history(250, seed))
+    legacy = pd.Series({(n, m): legacy_two_backtest(df.copy(), n, m) for n in windows for m in windows if n != m})
+    surface = backtest.multiples_to_frame(windows, backtest.sma_pair_multiples(df.Close, df.price, windows))
+    (n, m), multiple = backtest.best_window_pair(surface)
+    assert ((n, m), multiple) == (legacy.idxmax(), legacy.max())
+    for (n, m), expected in legacy.items():
+        assert surface.loc[n, m] == expected
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_multiple_parameter_optimizer_matches_legacy(seed):
+    history = make_history(250, seed)
+    opt = Optimized_Symbol.Multiple_Parameter_Optimizer(history)
+    df = add_lag_price(history)
+    surface = opt.surface
+    assert opt.optimum_multiple == surface.to_numpy().max()
+    # the optimum and a sample of the other pairs score the same as the legacy backtest
+    rng = np.random.default_rng(seed)
+    pairs = [(opt.optimum_window_1, opt.optimum_window_2)]
+    pairs += [tuple(int(w) for w in rng.choice(backtest.PAIR_WINDOWS, 2, replace=False)) for _ in range(10)]
+    for n, m in pairs:
+        assert surface.loc[n, m] == legacy_two_backtest(df.copy(), n, m)
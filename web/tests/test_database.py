@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import database
+import metrics
+from database import ConnectionPool, PoolTimeout
+
+
+def sqlite_pool(tmp_path, **kwargs):
+    path = str(tmp_path / 'pool.db')
+    return ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), **kwargs)
+
+
+def test_checkout_reuses_returned_connections(tmp_path):
+    pool = sqlite_pool(tmp_path, maxconn=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert (stats['checkouts'], stats['created'], stats['in_use'], stats['idle']) == (2, 1, 1, 0)
+
+
+def test_putconn_rolls_back_open_transactions(tmp_path):
+    pool = sqlite_pool(tmp_path, maxconn=1)
+    with pool.cursor(commit=True) as cur:
+        cur.execute('CREATE TABLE t (x INTEGER)')
+    with pool.connection() as conn:
+        conn.execute('INSERT INTO t VALUES (1)')
+    with pool.cursor() as cur:
+        cur.execute('SELECT count(*) FROM t')
+        assert cur.fetchone() == (0,)
+
+
+def test_cursor_commits_when_asked(tmp_path):
+    pool = sqlite_pool(tmp_path, maxconn=1)
+    with pool.cursor(commit=True) as cur:
+        cur.execute('CREATE TABLE t (x INTEGER)')
+        cur.execute('INSERT INTO t VALUES (1)')
+    with pool.cursor() as cur:
+        cur.execute('SELECT count(*) FROM t')
+        assert cur.fetchone() == (1,)
+
+
+def test_checkout_waits_for_a_connection_to_free_up(tmp_path):
+    pool = sqlite_pool(tmp_path, maxconn=1, timeout=5)
+    conn = pool.getconn()
+    threading.Timer(0.2, pool.putconn, (conn,)).start()
+    started = time.monotonic()
+    assert pool.getconn() is conn
+    assert time.monotonic() - started >= 0.15
+    stats = pool.stats()
+    assert stats['waits'] == 1 and stats['wait_seconds'] > 0
+
+
+def test_checkout_times_out(tmp_path):
+    pool = sqlite_pool(tmp_path, maxconn=1, timeout=0.1)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_failed_connect_frees_its_slot(tmp_path):
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError('unable to open database file')
+        return sqlite3.connect(':memory:')
+
+    pool = ConnectionPool(connect, maxconn=1, timeout=0.1)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.getconn()
+    assert pool.getconn() is not None
+
+
+def test_old_connections_are_recycled(tmp_path):
+    pool = sqlite_pool(tmp_path, maxconn=1, max_age=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    time.sleep(0.01)
+    assert pool.getconn() is not conn
+    stats = pool.stats()
+    assert (stats['recycled'], stats['created']) == (1, 2)
+
+
+def test_broken_connections_are_discarded(tmp_path):
+    pool = sqlite_pool(tmp_path, maxconn=1)
+    conn = pool.getconn()
+    conn.close()
+    # rollback on a closed sqlite3 connection raises, so the pool drops it
+    pool.putconn(conn)
+    assert pool.stats()['discarded'] == 1
+    assert pool.getconn() is not conn
+
+
+def test_fill_opens_minconn_idle_connections(tmp_path):
+    pool = sqlite_pool(tmp_path, minconn=3, maxconn=5)
+    pool.fill()
+    pool.fill()
+    assert (pool.stats()['idle'], pool.stats()['created']) == (3, 3)
+
+
+def test_forked_child_starts_with_an_empty_pool(tmp_path):
+    pool = sqlite_pool(tmp_path, maxconn=1)
+    borrowed = pool.getconn()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # the parent's connection is still checked out and the pool is
+            # full there, but the child gets its own connection right away
+            conn = pool.getconn()
+            ok = conn is not borrowed and pool.stats()['created'] == 1
+            # returning the parent's connection in the child is ignored
+            pool.putconn(borrowed)
+            ok = ok and pool.stats()['in_use'] == 1
+            os._exit(0 if ok else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    # the parent's pool is untouched
+    assert pool.stats()['in_use'] == 1
+    pool.putconn(borrowed)
+    assert pool.getconn() is borrowed
+
+
+def test_create_db_connection_times_queries(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_pool', sqlite_pool(tmp_path, maxconn=1))
+    before = metrics.STAGE_SECONDS.snapshot().get(('db_query',), [[0], 0.0])
+    conn, cur = database.create_db_connection()
+    cur.execute('SELECT 1')
+    assert cur.fetchone() == (1,)
+    database.close_db_connection(conn, cur)
+    after = metrics.STAGE_SECONDS.snapshot()[('db_query',)]
+    assert sum(after[0]) == sum(before[0]) + 1
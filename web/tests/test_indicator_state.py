@@ -0,0 +1,112 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import buy_sell
+import price_store
+from indicator_state import EXP_MA, SMA, IndicatorState, advance_states
+from tests.fixtures import make_history
+
+WINDOW = 10
+
+
+def split(history, ratio=2.0):
+    """`history` as Yahoo serves it after a `ratio`:1 split following its last bar."""
+    adjusted = history.copy()
+    adjusted[['Open', 'Close']] /= ratio
+    return adjusted
+
+
+def rebuilt(symbol, strategy, history):
+    return IndicatorState.rebuild(symbol, strategy, WINDOW, history['Open'], history.index.date)
+
+
+@pytest.mark.parametrize('strategy', [SMA, EXP_MA])
+def test_advance_states_matches_update(strategy):
+    history = make_history(120, tz='America/New_York')
+    expected = rebuilt('SYM', strategy, history)
+    state = rebuilt('SYM', strategy, history.iloc[:60])
+    advance_states([state], history['Open'].to_numpy()[None, 60:], [list(history.index.date[60:])])
+    assert state.to_row() == expected.to_row()
+
+
+def test_matches_price():
+    state = rebuilt('SYM', SMA, make_history(30))
+    assert state.matches_price(state.at_price)
+    assert state.matches_price(state.at_price * (1 + 1e-6))
+    assert not state.matches_price(state.at_price / 2)
+    assert not state.matches_price(np.nan)
+
+
+@pytest.fixture
+def histories(monkeypatch):
+    """Serves the dict's histories from the price store, for every period."""
+    served = {}
+    monkeypatch.setattr(price_store, 'get_history', lambda symbol, period='12mo': served[symbol].copy())
+    monkeypatch.setattr(buy_sell, 'get_symbol_optimum_window', lambda how, symbol: WINDOW)
+    return served
+
+
+@pytest.mark.parametrize('strategy', [SMA, EXP_MA])
+def test_calc_ma_price_updates_a_current_state(histories, strategy):
+    history = make_history(120, tz='America/New_York')
+    state = rebuilt('SYM', strategy, history.iloc[:-3])
+    histories['SYM'] = history
+    result = buy_sell.calc_ma_price(strategy, 'SYM', state)
+    assert result is state
+    assert result.to_row() == rebuilt('SYM', strategy, history).to_row()
+
+
+@pytest.mark.parametrize('strategy', [SMA, EXP_MA])
+def test_calc_ma_price_rebuilds_after_a_split(histories, strategy):
+    history = make_history(120, tz='America/New_York')
+    state = rebuilt('SYM', strategy, history.iloc[:-3])
+    histories['SYM'] = split(history)
+    result = buy_sell.calc_ma_price(strategy, 'SYM', state)
+    assert result is not state
+    assert result.to_row() == rebuilt('SYM', strategy, split(history)).to_row()
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    """run_batched against in-memory strategies, states and histories; returns what it writes."""
+    run = dict(strategies={}, stored={}, histories={}, written=[])
+
+    def load_histories(symbols, period='12mo', workers=8):
+        found = {s: run['histories'][s] for s in symbols if s in run['histories']}
+        return pd.concat(found, names=['Symbol', 'Date']) if found else pd.DataFrame()
+
+    @contextmanager
+    def cursor(commit=False):
+        yield None
+
+    class Pool:
+        pass
+    pool = Pool()
+    pool.cursor = cursor
+
+    monkeypatch.setattr(buy_sell, 'get_optimum_strategies', lambda: run['strategies'])
+    monkeypatch.setattr(buy_sell, 'read_states', lambda symbols: run['stored'])
+    monkeypatch.setattr(price_store, 'load_histories', load_histories)
+    monkeypatch.setattr(buy_sell.database, 'get_pool', lambda: pool)
+    monkeypatch.setattr(buy_sell, 'write_positions', lambda cur, states: None)
+    monkeypatch.setattr(buy_sell, 'write_states', lambda states, cur: run['written'].extend(states))
+    return run
+
+
+def test_run_batched_rebuilds_only_readjusted_states(batch):
+    history = make_history(120, tz='America/New_York')
+    for symbol in ('KEEP', 'SPLIT'):
+        batch['strategies'][symbol] = (SMA, WINDOW)
+        batch['stored'][symbol] = rebuilt(symbol, SMA, history.iloc[:-3])
+    batch['histories'] = {'KEEP': history, 'SPLIT': split(history)}
+
+    buy_sell.run_batched(workers=1)
+
+    written = {state.symbol: state for state in batch['written']}
+    assert written['KEEP'] is batch['stored']['KEEP']
+    assert written['KEEP'].to_row() == rebuilt('KEEP', SMA, history).to_row()
+    assert written['SPLIT'] is not batch['stored']['SPLIT']
+    assert written['SPLIT'].to_row() == rebuilt('SPLIT', SMA, split(history)).to_row()
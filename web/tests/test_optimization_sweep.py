@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import optimization_params_update as sweeper
+
+SYMBOLS = ['AAA', 'BBB', 'CCC', 'DDD']
+
+
+@pytest.fixture
+def optimized(monkeypatch):
+    """Records the symbols the sweep optimizes; a symbol listed in `stop_at` interrupts it."""
+    run = dict(symbols=[], stop_at=set())
+
+    def optimize_symbol(symbol, refresh=False):
+        if symbol in run['stop_at']:
+            run['stop_at'].discard(symbol)
+            raise KeyboardInterrupt
+        run['symbols'].append(symbol)
+        return symbol, [], 'ValueError: no history' if symbol == 'BBB' else None
+
+    monkeypatch.setattr(sweeper, 'optimize_symbol', optimize_symbol)
+    monkeypatch.setattr(sweeper.Optimum_Parameter_Writer, 'flush', lambda self: 0)
+    return run
+
+
+def test_interrupted_sweep_resumes_and_completed_sweep_starts_over(tmp_path, optimized):
+    checkpoint = str(tmp_path / 'optimization_checkpoint.tsv')
+    optimized['stop_at'] = {'CCC'}
+    with pytest.raises(KeyboardInterrupt):
+        sweeper.sweep(SYMBOLS, 1, checkpoint, batch_size=1)
+    assert sweeper.read_checkpoint(checkpoint) == {'AAA': 'done', 'BBB': 'failed'}
+
+    # the rerun picks up the same checkpoint, whatever the date
+    sweeper.sweep(SYMBOLS, 1, checkpoint, batch_size=1)
+    assert optimized['symbols'] == ['AAA', 'BBB', 'CCC', 'DDD']
+    assert not os.path.exists(checkpoint)
+    assert sweeper.read_checkpoint(f'{checkpoint}.last') == {'AAA': 'done', 'BBB': 'failed',
+                                                             'CCC': 'done', 'DDD': 'done'}
+
+    # a completed sweep leaves nothing to resume
+    optimized['symbols'].clear()
+    sweeper.sweep(SYMBOLS, 1, checkpoint, batch_size=1)
+    assert optimized['symbols'] == SYMBOLS
+    assert sorted(os.listdir(tmp_path)) == ['optimization_checkpoint.tsv.last']
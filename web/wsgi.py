@@ -0,0 +1,65 @@
+"""
+Production entry point: `gunicorn -c gunicorn.conf.py` (see gunicorn.conf.py).
+
+The app is imported once in the gunicorn master, and `preload` loads what
+every worker would otherwise load on its first requests: the modules the
+stock page imports lazily, the NLP lexicons and, with STOCK_PAGE_CACHE_WARM
+set, the leaderboard pages and the leaderboard symbols' stock pages. Workers
+are forked after that and share it all copy-on-write. `post_fork` then gives
+each worker its own thread pools and database connections.
+"""
+import time
+
+import app as stock_app
+import database
+import leaderboard
+import nlp
+
+application = stock_app.app
+
+
+def _step(name, fn):
+    started = time.monotonic()
+    try:
+        result = fn()
+    except Exception as e:
+        # a warm-up that fails only means slower first requests
+        print(f'Warm-up: {name} failed: {e}')
+        return None
+    print(f'Warm-up: {name} in {time.monotonic() - started:.2f}s')
+    return result
+
+
+def _import_lazy_modules():
+    import yfinance
+    import requests
+    import bs4
+    if stock_app.CHART_PAYLOAD != 'compact':
+        import plotly.graph_objects
+
+
+def _read_leaderboards():
+    for sort_by in leaderboard.SORT_KEYS:
+        leaderboard.page_info(sort_by)
+        leaderboard.read_page(sort_by)
+
+
+def preload(warm_pages=False):
+    """Runs once in the master, before any worker is forked."""
+    # nothing can still be running from before this server started
+    _step('job records', stock_app.job_store.abandon_active)
+    _step('lazy imports', _import_lazy_modules)
+    _step('NLP lexicons', nlp.get_engine)
+    if warm_pages:
+        _step('leaderboards', _read_leaderboards)
+        warmed = _step('stock pages', stock_app.warm_stock_page_cache)
+        if warmed is not None:
+            print(f'Warm-up: cached {warmed} stock pages')
+    # the workers open their own connections
+    database.close_all()
+
+
+def post_fork():
+    """Runs in every worker right after it is forked."""
+    stock_app.reset_after_fork()
+    _step('database pool', lambda: database.get_pool().fill())